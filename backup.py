@@ -0,0 +1,257 @@
+# backup.py
+# Respaldos en línea de la base de datos usando la API de backup de SQLite.
+# La copia se hace en lotes pequeños de páginas con pausas entre cada paso, de modo que
+# record_sale y el resto de escrituras pueden seguir confirmando mientras se respalda.
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from db import DATABASE_PATH, engine, get_catalog_version, install_catalog_version_triggers
+
+# Directorio donde se guardan los respaldos (configurable con INVENTORY_BACKUP_DIR)
+BACKUP_DIR = os.environ.get("INVENTORY_BACKUP_DIR", "backups")
+# Páginas copiadas por cada paso de la API de backup (lotes pequeños = bloqueos cortos)
+BACKUP_PAGES_PER_STEP = 64
+# Pausa en segundos entre pasos para ceder el turno a las ventas concurrentes
+BACKUP_STEP_SLEEP = 0.005
+# Intervalo por defecto entre respaldos automáticos (en segundos)
+BACKUP_INTERVAL_SECONDS = 60 * 60
+# Cantidad de respaldos más recientes que se mantienen sin comprimir
+BACKUP_KEEP_UNCOMPRESSED = 1
+# Cantidad máxima de respaldos a conservar; los más antiguos se eliminan
+BACKUP_MAX_SNAPSHOTS = 48
+# Reinicios tolerados de la copia por lotes (SQLite la reinicia cuando otra conexión confirma cambios)
+BACKUP_MAX_RESTARTS = 3
+# Segundos máximos de copia por lotes antes de terminar la copia en un solo paso
+BACKUP_INCREMENTAL_TIMEOUT = 30
+# Segundos máximos de espera por otro respaldo o restauración en curso
+BACKUP_LOCK_TIMEOUT = 120
+
+BACKUP_PREFIX = "inventory_"
+BACKUP_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S_%f"
+
+# Evita que dos respaldos o restauraciones corran al mismo tiempo
+_backup_lock = threading.Lock()
+# Estado del hilo de respaldos automáticos
+_scheduler_thread = None
+_scheduler_stop = threading.Event()
+_scheduler_lock = threading.Lock()
+
+
+# Función para verificar la integridad de un archivo de base de datos SQLite
+def verify_database(path):
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute("PRAGMA integrity_check").fetchone()
+        return result is not None and result[0] == "ok"
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        connection.close()
+
+
+# Se lanza desde el progreso de la copia por lotes para abandonarla y terminar en un solo paso
+class _IncrementalCopyAborted(Exception):
+    pass
+
+
+# Copia una base de datos a otra por lotes de páginas, cediendo el turno entre pasos.
+# Si las escrituras concurrentes reinician la copia más de BACKUP_MAX_RESTARTS veces, o si
+# tarda más de BACKUP_INCREMENTAL_TIMEOUT segundos, se termina con una copia en un solo paso,
+# que no puede reiniciarse; así la copia siempre termina.
+def _copy_online(source, target, pages=BACKUP_PAGES_PER_STEP):
+    if pages <= 0:
+        source.backup(target, pages=-1)
+        return
+
+    deadline = time.monotonic() + BACKUP_INCREMENTAL_TIMEOUT
+    state = {"remaining": None, "restarts": 0}
+
+    def _yield_between_steps(status, remaining, total):
+        # Si quedan más páginas que en el paso anterior, otra conexión confirmó y la copia volvió a empezar
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+        state["remaining"] = remaining
+        if state["restarts"] > BACKUP_MAX_RESTARTS or time.monotonic() > deadline:
+            raise _IncrementalCopyAborted()
+        # La API libera el bloqueo de lectura de la base origen al final de cada paso;
+        # dormir aquí deja que las ventas concurrentes confirmen entre lotes.
+        if remaining:
+            time.sleep(BACKUP_STEP_SLEEP)
+
+    try:
+        source.backup(target, pages=pages, progress=_yield_between_steps)
+    except _IncrementalCopyAborted:
+        source.backup(target, pages=-1)
+
+
+# Obtiene la fecha de un respaldo a partir de su nombre de archivo, o None si no es un respaldo
+def _parse_backup_timestamp(filename):
+    if not filename.startswith(BACKUP_PREFIX):
+        return None
+    stamp = filename[len(BACKUP_PREFIX):]
+    for suffix in (".db.gz", ".db"):
+        if stamp.endswith(suffix):
+            try:
+                return datetime.strptime(stamp[:-len(suffix)], BACKUP_TIMESTAMP_FORMAT)
+            except ValueError:
+                return None
+    return None
+
+
+# Función para listar los respaldos disponibles, del más reciente al más antiguo
+def list_backups():
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for filename in os.listdir(BACKUP_DIR):
+        timestamp = _parse_backup_timestamp(filename)
+        if timestamp is not None:
+            backups.append((timestamp, os.path.join(BACKUP_DIR, filename)))
+    backups.sort(reverse=True)
+    return backups
+
+
+# Comprime los respaldos antiguos y elimina los que exceden el máximo a conservar
+def rotate_backups():
+    for index, (timestamp, path) in enumerate(list_backups()):
+        if index >= BACKUP_MAX_SNAPSHOTS:
+            os.remove(path)
+        elif index >= BACKUP_KEEP_UNCOMPRESSED and not path.endswith(".gz"):
+            with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+
+
+# Función para crear un respaldo en línea de la base de datos
+def create_backup():
+    if not _backup_lock.acquire(timeout=BACKUP_LOCK_TIMEOUT):
+        return False, "Error: Hay otro respaldo o restauración en curso."
+    try:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        # El archivo parcial no tiene el formato de un respaldo, así que list_backups() lo ignora
+        partial_path = os.path.join(BACKUP_DIR, f"{BACKUP_PREFIX}{uuid.uuid4().hex}.db.part")
+        source = sqlite3.connect(DATABASE_PATH, timeout=30)
+        target = sqlite3.connect(partial_path)
+        try:
+            _copy_online(source, target)
+            # La copia puede reiniciarse varias veces; el respaldo se fecha cuando termina, porque
+            # contiene los cambios confirmados hasta ese momento
+            timestamp = datetime.now()
+        except Exception as e:
+            target.close()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return False, f"Error al crear respaldo: {e}"
+        finally:
+            source.close()
+        target.close()
+        filename = f"{BACKUP_PREFIX}{timestamp.strftime(BACKUP_TIMESTAMP_FORMAT)}.db"
+        final_path = os.path.join(BACKUP_DIR, filename)
+
+        if not verify_database(partial_path):
+            os.remove(partial_path)
+            return False, "Error: El respaldo generado no pasó la verificación de integridad."
+
+        os.replace(partial_path, final_path)
+        rotate_backups()
+        return True, f"Respaldo creado exitosamente: {final_path}"
+    finally:
+        _backup_lock.release()
+
+
+# Función para restaurar la base de datos al respaldo más reciente anterior o igual a point_in_time
+# Si point_in_time es None se usa el respaldo más reciente.
+def restore_backup(point_in_time=None):
+    candidates = [
+        (timestamp, path) for timestamp, path in list_backups()
+        if point_in_time is None or timestamp <= point_in_time
+    ]
+    if not candidates:
+        return False, "Error: No hay respaldos disponibles para la fecha indicada."
+    timestamp, path = candidates[0]
+
+    # Guarda el estado actual antes de sobrescribirlo, para poder deshacer la restauración
+    success, message = create_backup()
+    if not success:
+        return False, f"Error: No se pudo respaldar el estado actual antes de restaurar. {message}"
+
+    if not _backup_lock.acquire(timeout=BACKUP_LOCK_TIMEOUT):
+        return False, "Error: Hay otro respaldo o restauración en curso."
+    try:
+        # La rotación pudo haber comprimido el respaldo elegido; se vuelve a ubicar por su fecha
+        path = next((p for t, p in list_backups() if t == timestamp), None)
+        if path is None:
+            return False, "Error: El respaldo seleccionado ya no está disponible."
+        snapshot_path = path
+        temp_path = None
+        if path.endswith(".gz"):
+            handle, temp_path = tempfile.mkstemp(suffix=".db")
+            with os.fdopen(handle, "wb") as target, gzip.open(path, "rb") as source:
+                shutil.copyfileobj(source, target)
+            snapshot_path = temp_path
+        try:
+            if not verify_database(snapshot_path):
+                return False, f"Error: El respaldo {path} está dañado y no se restauró."
+
+            # El respaldo trae su propia versión del catálogo; se guarda la actual para no volver a un valor ya usado
+            catalog_version = get_catalog_version()
+            source = sqlite3.connect(snapshot_path)
+            target = sqlite3.connect(DATABASE_PATH, timeout=30)
+            try:
+                # La base de destino queda bloqueada durante toda la restauración, así que se copia en un solo paso
+                _copy_online(source, target, pages=-1)
+            finally:
+                source.close()
+                target.close()
+        except Exception as e:
+            return False, f"Error al restaurar respaldo: {e}"
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+        # Descarta las conexiones del pool para que las siguientes sesiones vean los datos restaurados
+        engine.dispose()
+        # Reinstala los triggers del catálogo (un respaldo antiguo puede no tenerlos) y avanza su versión,
+        # para que la matriz de precios en caché se recalcule en todos los procesos
+        install_catalog_version_triggers(engine, minimum_version=catalog_version + 1)
+
+        if not verify_database(DATABASE_PATH):
+            return False, "Error: La base de datos restaurada no pasó la verificación de integridad."
+        return True, f"Base de datos restaurada al respaldo del {timestamp.strftime('%Y-%m-%d %H:%M:%S')}."
+    finally:
+        _backup_lock.release()
+
+
+# Bucle del hilo de respaldos automáticos
+def _backup_loop(interval_seconds):
+    while not _scheduler_stop.wait(interval_seconds):
+        create_backup()
+
+
+# Inicia los respaldos automáticos en un hilo en segundo plano (solo uno por proceso)
+def start_backup_scheduler(interval_seconds=BACKUP_INTERVAL_SECONDS):
+    global _scheduler_thread
+    with _scheduler_lock:
+        if _scheduler_thread is not None and _scheduler_thread.is_alive():
+            return False
+        _scheduler_stop.clear()
+        _scheduler_thread = threading.Thread(target=_backup_loop, args=(interval_seconds,), name="inventory-backup", daemon=True)
+        _scheduler_thread.start()
+        return True
+
+
+# Detiene los respaldos automáticos
+def stop_backup_scheduler():
+    global _scheduler_thread
+    with _scheduler_lock:
+        _scheduler_stop.set()
+        if _scheduler_thread is not None:
+            _scheduler_thread.join()
+            _scheduler_thread = None
@@ -1,8 +1,13 @@
 # db.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, func, inspect, insert, Boolean, Column, Integer, String, Float, Date, DateTime, Enum, ForeignKey, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import enum
+import os
+import re
+import sqlite3
+import threading
 
 # Define la base declarativa para los modelos de SQLAlchemy
 Base = declarative_base()
@@ -25,8 +30,8 @@ class Product(Base):
 
     # Relación con la tabla de ventas, indica que un producto puede tener muchas ventas
     sales = relationship("Sale", back_populates="product")
-    # Relación con la tabla de modificaciones de inventario
-    modifications = relationship("InventoryModification", back_populates="product")
+    # Relación de solo lectura con el historial de modificaciones (el historial sobrevive a la eliminación del producto)
+    modifications = relationship("InventoryModification", viewonly=True)
 
 
     def __repr__(self):
@@ -43,8 +48,9 @@ class Sale(Base):
     discount = Column(Integer, default=0) # Descuento aplicado (entero, no porcentaje), por defecto 0
     unit_price_at_sale = Column(Float, nullable=False) # Precio unitario al momento de la venta
     total_price = Column(Float, nullable=False) # Precio total de la venta
-    sale_date = Column(DateTime, default=datetime.now) # Fecha y hora de la venta, por defecto la actual
+    sale_date = Column(DateTime, default=datetime.now, index=True) # Fecha y hora de la venta, por defecto la actual (indexada para consultas por rango)
     cost_price_at_sale = Column(Float, nullable=False, default=0.0) # Nuevo campo: Costo unitario al momento de la venta
+    price_type = Column(String) # Tipo de precio usado en la venta (ej. 'Caja Fria', 'six-pack'); None en ventas antiguas
 
     # Relación con la tabla de productos, indica que una venta pertenece a un producto
     product = relationship("Product", back_populates="sales")
@@ -53,39 +59,519 @@ class Sale(Base):
         # Representación en cadena del objeto Venta
         return f"<Sale(id={self.id}, product_id={self.product_id}, quantity={self.quantity}, total={self.total_price})>"
 
+# Tipos de cambio registrados en el historial de modificaciones
+class ChangeType(enum.Enum):
+    PRICE = "price" # Cambio de alguno de los precios (field_modified indica cuál)
+    STOCK = "stock" # Ajuste manual de stock
+    MIN_STOCK = "min_stock" # Cambio del stock mínimo
+    COST = "cost" # Cambio del valor de compra de la caja
+    PRODUCT_DELETION = "product_deletion" # Eliminación de un producto (old_value = stock, note = nombre)
+    SALE_DELETION = "sale_deletion" # Eliminación de una venta (quantity, amount, reference_id = ID de la venta)
+
+# Tipos de cambio cuyo old_value/new_value son el valor anterior y nuevo de un mismo campo
+VALUE_CHANGE_TYPES = (ChangeType.PRICE, ChangeType.STOCK, ChangeType.MIN_STOCK, ChangeType.COST)
+
 # Define el modelo de la tabla de Historial de Modificaciones de Inventario
+# Los valores se guardan como números; note solo se usa para datos de texto de las eliminaciones.
 class InventoryModification(Base):
-    __tablename__ = 'inventory_modifications' # Nombre de la tabla
+    __tablename__ = 'inventory_audit' # Nombre de la tabla
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
-    field_modified = Column(String, nullable=False) # Campo que fue modificado (ej. 'stock', 'price_caja_fria')
-    old_value = Column(String, nullable=False) # Valor anterior del campo (almacenado como string)
-    new_value = Column(String, nullable=False) # Nuevo valor del campo (almacenado como string)
-    modification_date = Column(DateTime, default=datetime.now) # Fecha y hora de la modificación
+    change_type = Column(Enum(ChangeType), nullable=False) # Tipo de cambio
+    field_modified = Column(String) # Campo que fue modificado (ej. 'stock', 'price_caja_fria')
+    old_value = Column(Float) # Valor anterior del campo
+    new_value = Column(Float) # Nuevo valor del campo
+    reference_id = Column(Integer) # ID relacionado (ej. la venta eliminada)
+    quantity = Column(Integer) # Unidades de la venta eliminada
+    amount = Column(Float) # Total de la venta eliminada
+    note = Column(String) # Texto adicional (ej. nombre del producto eliminado)
+    modification_date = Column(DateTime, default=datetime.now, index=True) # Fecha y hora de la modificación
 
     # Relación con la tabla de productos
-    product = relationship("Product", back_populates="modifications")
+    product = relationship("Product", viewonly=True)
+
+    __table_args__ = (
+        Index('ix_inventory_audit_product_date', 'product_id', 'modification_date'),
+    )
+
+    def __repr__(self):
+        return f"<InventoryModification(id={self.id}, product_id={self.product_id}, type={self.change_type}, field='{self.field_modified}', date={self.modification_date})>"
+
+# Define el modelo de la tabla de Resumen del Historial
+# Las modificaciones que superan la política de retención se resumen por producto, tipo, campo y mes
+# antes de eliminarse, para que el historial tenga un tamaño acotado.
+class InventoryModificationRollup(Base):
+    __tablename__ = 'inventory_audit_rollup'
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    change_type = Column(Enum(ChangeType), nullable=False)
+    field_modified = Column(String)
+    period_start = Column(Date, nullable=False) # Primer día del mes resumido
+    change_count = Column(Integer, nullable=False, default=0) # Cantidad de modificaciones resumidas
+    net_change = Column(Float, nullable=False, default=0.0) # Suma de (nuevo valor - valor anterior); 0 para las eliminaciones
+    first_date = Column(DateTime) # Primera modificación resumida
+    last_date = Column(DateTime) # Última modificación resumida
+
+    def __repr__(self):
+        return f"<InventoryModificationRollup(product_id={self.product_id}, type={self.change_type}, period={self.period_start}, count={self.change_count})>"
+
+# Un solo resumen por producto, tipo, campo y mes. El campo se compara con COALESCE porque SQLite
+# considera distintos los NULL de un índice único (las eliminaciones no tienen campo).
+Index(
+    'ux_inventory_audit_rollup_key',
+    InventoryModificationRollup.product_id,
+    InventoryModificationRollup.change_type,
+    func.coalesce(InventoryModificationRollup.field_modified, ''),
+    InventoryModificationRollup.period_start,
+    unique=True,
+)
+
+# Campos del producto cuyo historial de valores se guarda en price_history
+PRICE_HISTORY_FIELDS = ("price_caja_fria", "price_caja_caliente", "price_caja_particular", "price_six_pack", "price_unitario", "cost_price_box")
+# Inicio del primer tramo de un valor cuya fecha de alta no se conoce
+PRICE_HISTORY_START = datetime(1970, 1, 1)
+
+# Define el modelo de la tabla de Historial de Precios y Costos
+# Cada fila es el valor de un campo de un producto vigente entre effective_from (incluido)
+# y effective_to (excluido); effective_to es None para el valor vigente actualmente.
+class PriceHistory(Base):
+    __tablename__ = 'price_history'
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    field = Column(String, nullable=False) # Campo del producto (ej. 'price_caja_fria', 'cost_price_box')
+    value = Column(Float, nullable=False) # Valor del campo durante el tramo
+    effective_from = Column(DateTime, nullable=False) # Desde cuándo rige el valor
+    effective_to = Column(DateTime) # Hasta cuándo rige el valor (None = vigente)
+
+    __table_args__ = (
+        Index('ix_price_history_lookup', 'product_id', 'field', 'effective_from'),
+    )
+
+    def __repr__(self):
+        return f"<PriceHistory(product_id={self.product_id}, field='{self.field}', value={self.value}, from={self.effective_from}, to={self.effective_to})>"
+
+# Define el modelo de la tabla de Cierres de Caja
+# Cada fila es el resumen congelado de un día; solo se invalida (se elimina) si cambian las ventas de ese día.
+class DailyClose(Base):
+    __tablename__ = 'daily_close'
+
+    id = Column(Integer, primary_key=True)
+    close_date = Column(Date, unique=True, nullable=False) # Día que se cerró
+    sales_count = Column(Integer, nullable=False, default=0) # Cantidad de ventas del día
+    units = Column(Integer, nullable=False, default=0) # Unidades vendidas
+    gross_revenue = Column(Float, nullable=False, default=0.0) # Ingreso bruto (precio unitario x cantidad)
+    discounts = Column(Float, nullable=False, default=0.0) # Descuentos aplicados
+    net_revenue = Column(Float, nullable=False, default=0.0) # Ingreso neto (suma de precios totales)
+    cost = Column(Float, nullable=False, default=0.0) # Costo de lo vendido
+    profit = Column(Float, nullable=False, default=0.0) # Ganancia (ingreso neto - costo)
+    closed_at = Column(DateTime, default=datetime.now) # Fecha y hora en que se hizo el cierre
+    is_stale = Column(Boolean, nullable=False, default=False) # Se registraron ventas del día después del cierre
+
+    # Desglose por producto del cierre
+    items = relationship("DailyCloseItem", back_populates="daily_close", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<DailyClose(close_date={self.close_date}, net_revenue={self.net_revenue}, profit={self.profit})>"
+
+# Define el modelo de la tabla de Desglose por Producto de los Cierres de Caja
+class DailyCloseItem(Base):
+    __tablename__ = 'daily_close_items'
+
+    id = Column(Integer, primary_key=True)
+    daily_close_id = Column(Integer, ForeignKey('daily_close.id'), nullable=False, index=True)
+    product_id = Column(Integer, nullable=False) # Sin clave foránea: el producto puede eliminarse después del cierre
+    product_name = Column(String, nullable=False) # Nombre del producto al momento del cierre
+    sales_count = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    gross_revenue = Column(Float, nullable=False, default=0.0)
+    discounts = Column(Float, nullable=False, default=0.0)
+    net_revenue = Column(Float, nullable=False, default=0.0)
+    cost = Column(Float, nullable=False, default=0.0)
+    profit = Column(Float, nullable=False, default=0.0)
+
+    # Relación con el cierre de caja
+    daily_close = relationship("DailyClose", back_populates="items")
+
+    def __repr__(self):
+        return f"<DailyCloseItem(product_id={self.product_id}, units={self.units}, net_revenue={self.net_revenue})>"
+
+# Define el modelo de la tabla de Alertas de Stock Bajo
+# Esta tabla la mantienen los triggers de SQLite definidos más abajo: contiene una fila
+# por cada producto cuyo stock está por debajo del stock mínimo, de modo que consultar
+# las alertas cuesta O(alertas) y no O(catálogo).
+class StockAlert(Base):
+    __tablename__ = 'stock_alerts'
+
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    stock = Column(Integer, nullable=False) # Stock al momento de la última actualización de la alerta
+    min_stock = Column(Integer, nullable=False) # Stock mínimo configurado para el producto
+    alert_date = Column(DateTime, default=datetime.now) # Fecha y hora en que el producto cruzó el mínimo
+
+    # Relación de solo lectura con la tabla de productos (las filas las escriben los triggers)
+    product = relationship("Product", viewonly=True)
+
+    def __repr__(self):
+        return f"<StockAlert(product_id={self.product_id}, stock={self.stock}, min_stock={self.min_stock})>"
+
+
+# Triggers que mantienen la tabla stock_alerts sincronizada con products.
+# Se crean con IF NOT EXISTS para que también se instalen sobre bases de datos existentes.
+STOCK_ALERT_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stock_alert_insert
+    AFTER INSERT ON products
+    WHEN NEW.stock < NEW.min_stock
+    BEGIN
+        INSERT OR REPLACE INTO stock_alerts (product_id, stock, min_stock, alert_date)
+        VALUES (NEW.id, NEW.stock, NEW.min_stock, datetime('now', 'localtime'));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stock_alert_update
+    AFTER UPDATE OF stock, min_stock ON products
+    BEGIN
+        DELETE FROM stock_alerts
+        WHERE product_id = NEW.id AND NOT (NEW.stock < NEW.min_stock);
+        UPDATE stock_alerts SET stock = NEW.stock, min_stock = NEW.min_stock
+        WHERE product_id = NEW.id;
+        INSERT OR IGNORE INTO stock_alerts (product_id, stock, min_stock, alert_date)
+        SELECT NEW.id, NEW.stock, NEW.min_stock, datetime('now', 'localtime')
+        WHERE NEW.stock < NEW.min_stock;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stock_alert_delete
+    AFTER DELETE ON products
+    BEGIN
+        DELETE FROM stock_alerts WHERE product_id = OLD.id;
+    END
+    """,
+]
+
+# Instala los triggers y sincroniza las alertas con los productos ya existentes.
+# La sincronización recorre el catálogo una sola vez al iniciar; a partir de ahí
+# los triggers mantienen la tabla al día en cada venta o modificación.
+def install_stock_alert_triggers(engine):
+    with engine.begin() as connection:
+        for trigger_sql in STOCK_ALERT_TRIGGERS:
+            connection.execute(text(trigger_sql))
+        connection.execute(text(
+            "DELETE FROM stock_alerts WHERE product_id NOT IN "
+            "(SELECT id FROM products WHERE stock < min_stock)"
+        ))
+        connection.execute(text(
+            "UPDATE stock_alerts SET "
+            "stock = (SELECT stock FROM products WHERE products.id = stock_alerts.product_id), "
+            "min_stock = (SELECT min_stock FROM products WHERE products.id = stock_alerts.product_id)"
+        ))
+        connection.execute(text(
+            "INSERT OR IGNORE INTO stock_alerts (product_id, stock, min_stock, alert_date) "
+            "SELECT id, stock, min_stock, datetime('now', 'localtime') FROM products WHERE stock < min_stock"
+        ))
+
+# Define el modelo de la tabla de Versión del Catálogo
+# Tiene una sola fila con un contador que los triggers de más abajo incrementan cada vez que cambian
+# los productos, sus precios, su costo o sus unidades por caja (las ventas no lo modifican).
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
     def __repr__(self):
-        return f"<InventoryModification(id={self.id}, product_id={self.product_id}, field='{self.field_modified}', date={self.modification_date})>"
+        return f"<CatalogVersion(version={self.version})>"
+
+
+# Triggers que incrementan la versión del catálogo. Al estar en la base de datos, también
+# registran los cambios hechos por otros procesos.
+CATALOG_VERSION_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_catalog_version_insert
+    AFTER INSERT ON products
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_catalog_version_update
+    AFTER UPDATE OF name, price_caja_fria, price_caja_caliente, price_caja_particular, price_six_pack,
+        price_unitario, units_per_box, cost_price_box ON products
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_catalog_version_delete
+    AFTER DELETE ON products
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    """,
+]
+
+# Instala la tabla y los triggers de la versión del catálogo. Se vuelve a llamar después de restaurar
+# un respaldo con minimum_version mayor a la versión anterior, porque el respaldo trae su propio contador.
+def install_catalog_version_triggers(engine, minimum_version=0):
+    with engine.begin() as connection:
+        CatalogVersion.__table__.create(connection, checkfirst=True)
+        for trigger_sql in CATALOG_VERSION_TRIGGERS:
+            connection.execute(text(trigger_sql))
+        connection.execute(text("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)"))
+        connection.execute(
+            text("UPDATE catalog_version SET version = :minimum WHERE id = 1 AND version < :minimum"),
+            {"minimum": minimum_version},
+        )
+
+
+# Ruta del archivo de base de datos SQLite. Por defecto 'inventory.db' en el directorio actual;
+# se puede cambiar con la variable de entorno INVENTORY_DB_PATH (por ejemplo, para una base de pruebas).
+DATABASE_PATH = os.environ.get("INVENTORY_DB_PATH", "inventory.db")
+
+# Crea los índices definidos en los modelos que falten en tablas ya existentes
+# (create_all solo crea los índices al crear la tabla por primera vez)
+def create_missing_indexes(engine):
+    with engine.begin() as connection:
+        # Se consulta sqlite_master porque la reflexión de SQLAlchemy no ve los índices sobre expresiones
+        existing_indexes = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+
+# Junta los resúmenes del historial repetidos (con la misma clave) en uno solo, para poder crear su
+# índice único en bases de datos existentes. También elimina el índice anterior, que no era único.
+def merge_duplicate_audit_rollups(engine):
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX IF EXISTS ix_inventory_audit_rollup_key"))
+        duplicates = connection.execute(text(
+            "SELECT MIN(id), SUM(change_count), SUM(net_change), MIN(first_date), MAX(last_date), "
+            "product_id, change_type, COALESCE(field_modified, ''), period_start "
+            "FROM inventory_audit_rollup "
+            "GROUP BY product_id, change_type, COALESCE(field_modified, ''), period_start HAVING COUNT(*) > 1"
+        )).all()
+        for keep_id, change_count, net_change, first_date, last_date, product_id, change_type, field, period_start in duplicates:
+            key = {"product_id": product_id, "change_type": change_type, "field": field, "period_start": period_start, "keep_id": keep_id}
+            connection.execute(text(
+                "DELETE FROM inventory_audit_rollup WHERE product_id = :product_id AND change_type = :change_type "
+                "AND COALESCE(field_modified, '') = :field AND period_start = :period_start AND id != :keep_id"
+            ), key)
+            connection.execute(text(
+                "UPDATE inventory_audit_rollup SET change_count = :change_count, net_change = :net_change, "
+                "first_date = :first_date, last_date = :last_date WHERE id = :keep_id"
+            ), {"change_count": change_count, "net_change": net_change, "first_date": first_date, "last_date": last_date, "keep_id": keep_id})
+
+# Agrega a las tablas existentes las columnas nuevas de los modelos (create_all no modifica tablas existentes)
+# Las columnas NOT NULL se agregan con su valor por defecto del modelo.
+def add_missing_columns(engine):
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.execute(text(ddl))
+
+
+# Ajustes del motor SQLite, configurables por variables de entorno para poder comparar
+# configuraciones (por ejemplo con load_test.py) sin cambiar el código:
+# - INVENTORY_DB_JOURNAL_MODE: modo de journal (ej. 'WAL'); si no se indica se usa el de la base de datos
+# - INVENTORY_DB_SYNCHRONOUS: nivel de sincronización (ej. 'NORMAL', 'FULL')
+# - INVENTORY_DB_BUSY_TIMEOUT: segundos que una conexión espera un bloqueo antes de fallar con 'database is locked'
+DATABASE_JOURNAL_MODE = os.environ.get("INVENTORY_DB_JOURNAL_MODE")
+DATABASE_SYNCHRONOUS = os.environ.get("INVENTORY_DB_SYNCHRONOUS")
+DATABASE_BUSY_TIMEOUT = float(os.environ.get("INVENTORY_DB_BUSY_TIMEOUT", "5"))
+
+# Clasifica un campo modificado del historial anterior en su tipo de cambio
+def _legacy_change_type(field):
+    if field.startswith("price_"):
+        return ChangeType.PRICE
+    return {
+        "stock": ChangeType.STOCK,
+        "min_stock": ChangeType.MIN_STOCK,
+        "cost_price_box": ChangeType.COST,
+        "product_deletion": ChangeType.PRODUCT_DELETION,
+        "sale_deletion": ChangeType.SALE_DELETION,
+    }.get(field)
+
+# Convierte un valor de texto del historial anterior a número, o None si no es numérico
+def _legacy_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Copia una sola vez el historial anterior (tabla inventory_modifications, con valores en texto)
+# a la tabla tipada inventory_audit. La tabla anterior se conserva renombrada como
+# inventory_modifications_legacy, lo que además marca la migración como hecha.
+def migrate_legacy_modifications(engine):
+    if not inspect(engine).has_table('inventory_modifications'):
+        return
+    with engine.begin() as connection:
+        legacy_rows = connection.execute(text(
+            "SELECT product_id, field_modified, old_value, new_value, modification_date "
+            "FROM inventory_modifications ORDER BY id"
+        )).all()
+        rows = []
+        for product_id, field, old_value, new_value, modification_date in legacy_rows:
+            change_type = _legacy_change_type(field)
+            if change_type is None:
+                continue
+            row = {
+                "product_id": product_id,
+                "change_type": change_type,
+                "field_modified": field,
+                "old_value": _legacy_number(old_value),
+                "new_value": _legacy_number(new_value),
+                "reference_id": None,
+                "quantity": None,
+                "amount": None,
+                "note": None,
+                "modification_date": datetime.fromisoformat(modification_date) if modification_date else None,
+            }
+            if change_type in (ChangeType.PRODUCT_DELETION, ChangeType.SALE_DELETION):
+                row["field_modified"] = None
+            if change_type is ChangeType.PRODUCT_DELETION:
+                match = re.match(r"Producto: (.*), ID: \d+$", old_value or "")
+                row["note"] = match.group(1) if match else old_value
+            elif change_type is ChangeType.SALE_DELETION:
+                match = re.match(r"Venta ID: (\d+), Producto: .*, Cantidad: (\d+), Total: ([\d.]+)$", old_value or "")
+                row["old_value"] = row["new_value"] = None
+                if match:
+                    row["reference_id"] = int(match.group(1))
+                    row["quantity"] = int(match.group(2))
+                    row["amount"] = float(match.group(3))
+                else:
+                    row["note"] = old_value
+            rows.append(row)
+        if rows:
+            connection.execute(insert(InventoryModification), rows)
+        connection.execute(text("ALTER TABLE inventory_modifications RENAME TO inventory_modifications_legacy"))
+
+# Mueve la cantidad y el total de las ventas eliminadas registradas en old_value/new_value
+# a sus propias columnas, y quita de los resúmenes el net_change calculado para eliminaciones.
+# Después de la primera ejecución no quedan filas que cumplan las condiciones.
+def normalize_deletion_audit_values(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "UPDATE inventory_audit SET quantity = CAST(old_value AS INTEGER), amount = new_value, old_value = NULL, new_value = NULL "
+            "WHERE change_type = 'SALE_DELETION' AND (old_value IS NOT NULL OR new_value IS NOT NULL)"
+        ))
+        connection.execute(text(
+            "UPDATE inventory_audit_rollup SET net_change = 0 "
+            "WHERE change_type IN ('PRODUCT_DELETION', 'SALE_DELETION') AND net_change != 0"
+        ))
+
+# Llena price_history una sola vez a partir de los cambios de precio y costo del historial de modificaciones.
+# El valor anterior al primer cambio registrado rige desde PRICE_HISTORY_START, y el último tramo
+# toma el valor actual del producto (el historial pudo haberse resumido por la política de retención).
+def backfill_price_history(engine):
+    with engine.begin() as connection:
+        if connection.execute(text("SELECT 1 FROM price_history LIMIT 1")).first():
+            return
+        products = connection.execute(text(
+            f"SELECT id, {', '.join(PRICE_HISTORY_FIELDS)} FROM products"
+        )).all()
+        if not products:
+            return
+        changes = {}
+        for product_id, field, old_value, new_value, modification_date in connection.execute(
+            text(
+                "SELECT product_id, field_modified, old_value, new_value, modification_date FROM inventory_audit "
+                "WHERE change_type IN ('PRICE', 'COST') AND old_value IS NOT NULL AND new_value IS NOT NULL "
+                "ORDER BY product_id, field_modified, modification_date, id"
+            )
+        ):
+            changes.setdefault((product_id, field), []).append((old_value, new_value, datetime.fromisoformat(modification_date)))
+
+        rows = []
+        for product in products:
+            product_id = product[0]
+            for field, current_value in zip(PRICE_HISTORY_FIELDS, product[1:]):
+                effective_from = PRICE_HISTORY_START
+                for old_value, new_value, modification_date in changes.get((product_id, field), []):
+                    rows.append({"product_id": product_id, "field": field, "value": old_value, "effective_from": effective_from, "effective_to": modification_date})
+                    effective_from = modification_date
+                rows.append({"product_id": product_id, "field": field, "value": current_value, "effective_from": effective_from, "effective_to": None})
+        connection.execute(insert(PriceHistory), rows)
 
 
 # Configura la conexión a la base de datos SQLite
 # 'sqlite:///inventory.db' crea un archivo de base de datos llamado 'inventory.db' en el mismo directorio
-engine = create_engine('sqlite:///inventory.db')
+engine = create_engine(f'sqlite:///{DATABASE_PATH}', connect_args={"timeout": DATABASE_BUSY_TIMEOUT})
+
+# Aplica los PRAGMA configurados a cada nueva conexión
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if DATABASE_JOURNAL_MODE and DATABASE_JOURNAL_MODE.isalpha():
+        cursor.execute(f"PRAGMA journal_mode={DATABASE_JOURNAL_MODE}")
+    if DATABASE_SYNCHRONOUS and DATABASE_SYNCHRONOUS.isalpha():
+        cursor.execute(f"PRAGMA synchronous={DATABASE_SYNCHRONOUS}")
+    cursor.close()
 
 # Crea todas las tablas definidas en los modelos en la base de datos
-# Si ya existe una base de datos, esto no la sobrescribirá, solo agregará la nueva columna si es necesario.
-# Sin embargo, para que los cambios en la estructura de la tabla (como añadir una nueva columna)
-# se apliquen a una base de datos existente, a menudo se necesita una herramienta de migración (como Alembic).
-# Para este ejemplo, si ya tienes datos, es posible que necesites borrar inventory.db y volver a ejecutar
-# para que la nueva columna 'cost_price_at_sale' se cree con el default.
+# Si ya existe una base de datos, esto no la sobrescribirá; solo crea las tablas que falten.
 Base.metadata.create_all(engine)
 
+# Agrega las columnas nuevas (como 'cost_price_at_sale' o 'price_type') a las tablas existentes
+add_missing_columns(engine)
+
+# Junta los resúmenes del historial repetidos antes de crear su índice único
+merge_duplicate_audit_rollups(engine)
+
+# Crea los índices nuevos sobre bases de datos existentes (por ejemplo, el índice de sales.sale_date)
+create_missing_indexes(engine)
+
+# Migra el historial de modificaciones anterior al formato tipado
+migrate_legacy_modifications(engine)
+
+# Corrige los valores de las eliminaciones de ventas registradas con el formato anterior
+normalize_deletion_audit_values(engine)
+
+# Llena el historial de precios y costos a partir del historial de modificaciones
+backfill_price_history(engine)
+
+# Instala los triggers de alertas de stock bajo
+install_stock_alert_triggers(engine)
+
+# Instala los triggers de la versión del catálogo (usada por la caché de la matriz de precios)
+install_catalog_version_triggers(engine)
+
 # Crea una clase de sesión para interactuar con la base de datos
 Session = sessionmaker(bind=engine)
 
 # Función para obtener una nueva sesión de base de datos
 def get_db_session():
     return Session()
+
+# Conexión de solo lectura dedicada a consultar la versión de los datos
+_version_connection = None
+_version_lock = threading.Lock()
+
+# Función para obtener la versión de los datos. PRAGMA data_version cambia cada vez que otra conexión
+# confirma cambios: las sesiones de este proceso, otros procesos y las restauraciones de respaldos.
+def get_data_version():
+    global _version_connection
+    with _version_lock:
+        if _version_connection is None:
+            _version_connection = sqlite3.connect(f"file:{os.path.abspath(DATABASE_PATH)}?mode=ro", uri=True, check_same_thread=False)
+        return _version_connection.execute("PRAGMA data_version").fetchone()[0]
+
+# Función para obtener la versión del catálogo. A diferencia de get_data_version, no cambia con las ventas.
+def get_catalog_version():
+    global _version_connection
+    with _version_lock:
+        if _version_connection is None:
+            _version_connection = sqlite3.connect(f"file:{os.path.abspath(DATABASE_PATH)}?mode=ro", uri=True, check_same_thread=False)
+        return _version_connection.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
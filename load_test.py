@@ -0,0 +1,261 @@
+# load_test.py
+# Prueba de carga con varias cajas registradoras concurrentes contra una base de datos temporal.
+# Cada sesión de cajero ejecuta una mezcla configurable de operaciones de main.py y al final se
+# informa el rendimiento, las latencias p50/p95/p99, los reintentos por bloqueo y las operaciones fallidas.
+#
+# Ejemplos:
+#   python load_test.py --sessions 8 --duration 20
+#   python load_test.py --sessions 8 --mode processes --journal-mode WAL --synchronous NORMAL
+#   python load_test.py --mix sale=70,update=5,products=15,report=10 --json
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Mezcla de operaciones por defecto (pesos relativos)
+DEFAULT_MIX = "sale=60,update=10,products=20,report=10"
+# Cantidad de productos con los que se llena la base temporal
+DEFAULT_PRODUCTS = 200
+# Reintentos máximos cuando una operación falla por 'database is locked'
+DEFAULT_MAX_RETRIES = 5
+# Espera base entre reintentos (se duplica en cada intento)
+RETRY_BACKOFF_SECONDS = 0.01
+
+
+# Convierte una cadena 'sale=60,update=10' en un diccionario de pesos
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Operación desconocida en la mezcla: '{name}'. Opciones: {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+# Indica si un error corresponde a un bloqueo de SQLite
+def _is_lock_error(message):
+    return "locked" in message or "busy" in message
+
+
+# --- Operaciones de un cajero ---
+# Cada operación retorna (éxito, mensaje) igual que las funciones de main.py.
+
+def _op_sale(main, product_ids):
+    product_id = random.choice(product_ids)
+    quantity = random.randint(1, 6)
+    return main.record_sale(
+        product_id=product_id,
+        quantity=quantity,
+        unit_price_at_sale=1000.0,
+        total_price=1000.0 * quantity,
+        discount=0,
+        cost_price_at_sale=600.0
+    )
+
+def _op_update(main, product_ids):
+    product = main.get_product_by_id(random.choice(product_ids))
+    if product is None:
+        return False, "Error: Producto no encontrado."
+    success, message = main.update_product_details(
+        product_id=product.id,
+        new_prices={"price_unitario": round(random.uniform(900, 1100), 2)},
+        new_stock=product.stock,
+        new_min_stock=product.min_stock,
+        new_cost_price_box=product.cost_price_box
+    )
+    if not success and message.startswith("No se detectaron cambios"):
+        return True, message # El precio sorteado coincidió con el actual; no es un fallo
+    return success, message
+
+def _op_products(main, product_ids):
+    main.get_all_products()
+    return True, ""
+
+def _op_report(main, product_ids):
+    main.get_all_sales()
+    return True, ""
+
+OPERATIONS = {
+    "sale": _op_sale,
+    "update": _op_update,
+    "products": _op_products,
+    "report": _op_report,
+}
+
+
+# Ejecuta una operación reintentando si falla por bloqueo de la base de datos
+def _run_operation(main, name, product_ids, max_retries):
+    retries = 0
+    while True:
+        try:
+            success, message = OPERATIONS[name](main, product_ids)
+        except Exception as e:
+            success, message = False, str(e)
+        if success or not _is_lock_error(message) or retries >= max_retries:
+            return success, retries
+        time.sleep(RETRY_BACKOFF_SECONDS * (2 ** retries))
+        retries += 1
+
+
+# Sesión de un cajero: ejecuta operaciones hasta que se cumpla la duración
+def run_session(session_id, weights, product_ids, start_at, duration, max_retries, seed):
+    import main # Se importa aquí para que cada proceso use la base configurada por variables de entorno
+
+    random.seed(seed + session_id)
+    names = list(weights)
+    name_weights = [weights[name] for name in names]
+    results = {name: {"latencies": [], "retries": 0, "failed": 0} for name in names}
+
+    time.sleep(max(0.0, start_at - time.time())) # Todas las sesiones arrancan al mismo tiempo
+    end_at = start_at + duration
+    while time.time() < end_at:
+        name = random.choices(names, weights=name_weights)[0]
+        started = time.perf_counter()
+        success, retries = _run_operation(main, name, product_ids, max_retries)
+        elapsed = time.perf_counter() - started
+        results[name]["retries"] += retries
+        if success:
+            results[name]["latencies"].append(elapsed)
+        else:
+            results[name]["failed"] += 1
+    return results
+
+
+# Crea la base temporal y la llena con productos con stock suficiente para toda la prueba
+def seed_database(product_count):
+    import main
+
+    for i in range(product_count):
+        success, message = main.add_product(
+            name=f"Producto de prueba {i + 1}",
+            price_caja_fria=24000.0,
+            price_caja_caliente=22000.0,
+            price_caja_particular=26000.0,
+            price_six_pack=6500.0,
+            price_unitario=1000.0,
+            stock=10_000_000,
+            min_stock=10,
+            units_per_box=24,
+            cost_price_box=14400.0
+        )
+        if not success:
+            raise RuntimeError(message)
+    return [p.id for p in main.get_all_products()]
+
+
+# Percentil por rango más cercano sobre una lista ordenada
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# Combina los resultados de todas las sesiones y calcula las métricas
+def summarize(session_results, elapsed):
+    merged = {}
+    for results in session_results:
+        for name, data in results.items():
+            entry = merged.setdefault(name, {"latencies": [], "retries": 0, "failed": 0})
+            entry["latencies"].extend(data["latencies"])
+            entry["retries"] += data["retries"]
+            entry["failed"] += data["failed"]
+    merged["total"] = {
+        "latencies": [lat for name in list(merged) for lat in merged[name]["latencies"]],
+        "retries": sum(data["retries"] for data in merged.values()),
+        "failed": sum(data["failed"] for data in merged.values()),
+    }
+
+    summary = {}
+    for name, data in merged.items():
+        latencies = sorted(data["latencies"])
+        summary[name] = {
+            "ok": len(latencies),
+            "failed": data["failed"],
+            "lock_retries": data["retries"],
+            "throughput_per_s": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    return summary
+
+
+# Muestra el resumen como tabla
+def print_summary(summary, args):
+    print(f"Sesiones: {args.sessions} ({args.mode}) | Duración: {args.duration}s | "
+          f"journal_mode={args.journal_mode or 'por defecto'} synchronous={args.synchronous or 'por defecto'} "
+          f"busy_timeout={args.busy_timeout}s")
+    header = f"{'operación':<10} {'ok':>8} {'fallidas':>9} {'reintentos':>11} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in summary.items():
+        print(f"{name:<10} {row['ok']:>8} {row['failed']:>9} {row['lock_retries']:>11} {row['throughput_per_s']:>9.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Prueba de carga con cajas registradoras concurrentes.")
+    parser.add_argument("--sessions", type=int, default=4, help="Cantidad de cajeros concurrentes")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duración de la prueba en segundos")
+    parser.add_argument("--mode", choices=["threads", "processes"], default="threads", help="Simular cajeros con hilos o con procesos")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Mezcla de operaciones (por defecto: {DEFAULT_MIX})")
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS, help="Productos en la base temporal")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="Reintentos ante 'database is locked'")
+    parser.add_argument("--journal-mode", help="PRAGMA journal_mode (ej. WAL, DELETE)")
+    parser.add_argument("--synchronous", help="PRAGMA synchronous (ej. NORMAL, FULL)")
+    parser.add_argument("--busy-timeout", type=float, default=5.0, help="Segundos de espera ante un bloqueo")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla aleatoria")
+    parser.add_argument("--json", action="store_true", help="Mostrar el resultado en formato JSON")
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    scratch_dir = tempfile.mkdtemp(prefix="inventory_load_test_")
+    try:
+        # Se configura la base temporal antes de importar db.py, en este proceso y en los hijos
+        os.environ["INVENTORY_DB_PATH"] = os.path.join(scratch_dir, "inventory.db")
+        os.environ["INVENTORY_DB_BUSY_TIMEOUT"] = str(args.busy_timeout)
+        if args.journal_mode:
+            os.environ["INVENTORY_DB_JOURNAL_MODE"] = args.journal_mode
+        if args.synchronous:
+            os.environ["INVENTORY_DB_SYNCHRONOUS"] = args.synchronous
+
+        product_ids = seed_database(args.products)
+        start_at = time.time() + (5.0 if args.mode == "processes" else 1.0) # Margen para que arranquen todas las sesiones
+        session_args = [(i, weights, product_ids, start_at, args.duration, args.max_retries, args.seed) for i in range(args.sessions)]
+
+        if args.mode == "processes":
+            # 'spawn' evita que los hijos hereden las conexiones SQLite abiertas por este proceso
+            with ProcessPoolExecutor(max_workers=args.sessions, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(run_session, *a) for a in session_args]
+                session_results = [f.result() for f in futures]
+        else:
+            session_results = [None] * args.sessions
+            def _thread_target(index, a):
+                session_results[index] = run_session(*a)
+            threads = [threading.Thread(target=_thread_target, args=(i, a)) for i, a in enumerate(session_args)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        summary = summarize(session_results, args.duration)
+        if args.json:
+            print(json.dumps({"config": vars(args), "results": summary}, indent=2))
+        else:
+            print_summary(summary, args)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_cli()
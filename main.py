@@ -1,7 +1,69 @@
 # main.py
-from db import Product, Sale, InventoryModification, get_db_session
+from db import Product, Sale, InventoryModification, InventoryModificationRollup, ChangeType, VALUE_CHANGE_TYPES, StockAlert, DailyClose, DailyCloseItem, PriceHistory, PRICE_HISTORY_FIELDS, get_db_session, get_catalog_version
+from sqlalchemy import and_, case, func, insert, or_, select, text, update
 from sqlalchemy.exc import IntegrityError
-from datetime import datetime
+from sqlalchemy.orm import aliased, joinedload
+from datetime import datetime, timedelta
+import threading
+import pandas as pd
+
+# Política de retención del historial de modificaciones: las modificaciones con más de
+# AUDIT_RETENTION_DAYS días, o que excedan AUDIT_MAX_ROWS filas, se resumen por mes y se eliminan.
+AUDIT_RETENTION_DAYS = 365
+AUDIT_MAX_ROWS = 50000
+# Intervalo por defecto entre aplicaciones automáticas de la política de retención (en segundos)
+AUDIT_RETENTION_INTERVAL_SECONDS = 24 * 60 * 60
+# Cantidad de modificaciones por página en el historial
+AUDIT_PAGE_SIZE = 50
+
+# Tipos de precio: columna del producto con el precio y unidades que incluye cada paquete
+# (None = las unidades por caja del producto)
+PRICE_TYPES = {
+    "Caja Fria": ("price_caja_fria", None),
+    "Caja Caliente": ("price_caja_caliente", None),
+    "Caja Particular": ("price_caja_particular", None),
+    "six-pack": ("price_six_pack", 6),
+    "Unitario": ("price_unitario", 1),
+}
+
+# Matriz de precios precalculada: (versión del catálogo, matriz). Se recalcula cuando cambia
+# la versión del catálogo, sin importar qué proceso o conexión hizo el cambio; las ventas no la invalidan.
+_price_matrix_cache = None
+
+# Funciones que se llaman cuando un producto cruza por primera vez por debajo de su stock mínimo.
+# Cada función recibe (product_id, product_name, stock, min_stock).
+_stock_alert_listeners = []
+
+# Estado del hilo que aplica la política de retención del historial
+_retention_thread = None
+_retention_stop = threading.Event()
+_retention_lock = threading.Lock()
+# Resultado de la última aplicación de la retención: (fecha, éxito, mensaje), o None si aún no se aplicó
+_last_audit_retention = None
+# Evita que dos aplicaciones de la retención (el hilo periódico y el botón de la interfaz) se superpongan
+_audit_retention_run_lock = threading.Lock()
+
+# Registra una función que será notificada cuando un producto entre en alerta de stock bajo
+def register_stock_alert_listener(callback):
+    if callback not in _stock_alert_listeners:
+        _stock_alert_listeners.append(callback)
+
+# Elimina una función previamente registrada
+def unregister_stock_alert_listener(callback):
+    if callback in _stock_alert_listeners:
+        _stock_alert_listeners.remove(callback)
+
+# Indica si un stock está por debajo del mínimo (misma condición que usan los triggers de la base de datos)
+def _is_low_stock(stock, min_stock):
+    return stock is not None and min_stock is not None and stock < min_stock
+
+# Notifica a los listeners registrados. Un error en un listener no debe afectar a la operación ya confirmada.
+def _fire_stock_alert(product_id, product_name, stock, min_stock):
+    for callback in list(_stock_alert_listeners):
+        try:
+            callback(product_id, product_name, stock, min_stock)
+        except Exception:
+            pass
 
 # Función para agregar un nuevo producto a la base de datos
 def add_product(name, price_caja_fria, price_caja_caliente, price_caja_particular, price_six_pack, price_unitario, stock, min_stock, units_per_box, cost_price_box):
@@ -21,6 +83,12 @@ def add_product(name, price_caja_fria, price_caja_caliente, price_caja_particula
             cost_price_box=cost_price_box # Nuevo campo
         )
         session.add(new_product) # Agrega el nuevo producto a la sesión
+        session.flush() # Obtiene el id del producto para su historial de precios
+        # Los precios y el costo iniciales rigen desde el alta del producto
+        session.execute(insert(PriceHistory), [
+            {"product_id": new_product.id, "field": field, "value": getattr(new_product, field), "effective_from": datetime.now()}
+            for field in PRICE_HISTORY_FIELDS
+        ])
         session.commit() # Confirma los cambios en la base de datos
         return True, "Producto agregado exitosamente." # Retorna éxito
     except IntegrityError:
@@ -53,7 +121,8 @@ def get_product_by_id(product_id):
 # Función para registrar una venta
 # Modificada para recibir unit_price_at_sale y total_price ya calculados desde la UI
 # Ahora también recibe cost_price_at_sale para almacenarlo en el registro de venta
-def record_sale(product_id, quantity, unit_price_at_sale, total_price, discount, cost_price_at_sale):
+# price_type indica el tipo de precio usado (una clave de PRICE_TYPES)
+def record_sale(product_id, quantity, unit_price_at_sale, total_price, discount, cost_price_at_sale, price_type=None):
     session = get_db_session() # Obtiene una nueva sesión de base de datos
     try:
         product = session.query(Product).filter_by(id=product_id).first() # Busca el producto por su ID
@@ -63,6 +132,7 @@ def record_sale(product_id, quantity, unit_price_at_sale, total_price, discount,
         if product.stock < quantity:
             return False, "Error: No hay suficiente stock disponible." # Retorna error si no hay stock suficiente
 
+        sale_date = datetime.now()
         # Crea una nueva instancia de Venta
         new_sale = Sale(
             product_id=product.id,
@@ -70,15 +140,27 @@ def record_sale(product_id, quantity, unit_price_at_sale, total_price, discount,
             discount=discount,
             unit_price_at_sale=unit_price_at_sale, # Precio unitario real de la venta
             total_price=total_price, # Precio total de la venta
-            sale_date=datetime.now(), # Registra la fecha y hora actual de la venta
-            cost_price_at_sale=cost_price_at_sale # Nuevo campo: Costo unitario al momento de la venta
+            sale_date=sale_date, # Registra la fecha y hora actual de la venta
+            cost_price_at_sale=cost_price_at_sale, # Nuevo campo: Costo unitario al momento de la venta
+            price_type=price_type # Tipo de precio usado en la venta
         )
         session.add(new_sale) # Agrega la nueva venta a la sesión
+        # Si el día ya estaba cerrado, el cierre se conserva pero queda marcado como desactualizado
+        close_is_stale = _mark_daily_close_stale(session, sale_date)
 
+        was_low_stock = _is_low_stock(product.stock, product.min_stock)
         product.stock -= quantity # Reduce el stock del producto por la cantidad total de unidades
-        session.commit() # Confirma los cambios en la base de datos
+        session.commit() # Confirma los cambios en la base de datos (los triggers actualizan stock_alerts)
 
-        return True, "Venta registrada exitosamente." # Retorna éxito
+        # Si la venta hizo cruzar el stock por debajo del mínimo, dispara el evento de alerta
+        if not was_low_stock and _is_low_stock(product.stock, product.min_stock):
+            _fire_stock_alert(product.id, product.name, product.stock, product.min_stock)
+            message = f"Venta registrada exitosamente. ALERTA: '{product.name}' quedó con stock bajo ({product.stock} < {product.min_stock})."
+        else:
+            message = "Venta registrada exitosamente."
+        if close_is_stale:
+            message += " La caja de hoy ya estaba cerrada; el cierre quedó desactualizado y debe volver a cerrarse."
+        return True, message # Retorna éxito
     except Exception as e:
         session.rollback() # Si hay un error, revierte la transacción
         return False, f"Error al registrar venta: {e}" # Retorna error con el mensaje de la excepción
@@ -104,6 +186,7 @@ def update_product_details(product_id, new_prices, new_stock, new_min_stock, new
             return False, "Error: Producto no encontrado."
 
         changes_made = False
+        was_low_stock = _is_low_stock(product.stock, product.min_stock)
         # Lista para almacenar los detalles de los cambios realizados
         change_records = []
 
@@ -153,18 +236,52 @@ def update_product_details(product_id, new_prices, new_stock, new_min_stock, new
             })
 
         if changes_made:
-            # Registrar cada cambio individualmente en el historial
-            for record in change_records:
-                new_modification = InventoryModification(
-                    product_id=product.id,
-                    field_modified=record["field"],
-                    old_value=str(record["old_value"]), # Convertir a string para almacenar
-                    new_value=str(record["new_value"]), # Convertir a string para almacenar
-                    modification_date=datetime.now()
+            # Registrar todos los cambios en el historial con una sola inserción masiva
+            modification_date = datetime.now()
+            session.execute(insert(InventoryModification), [
+                {
+                    "product_id": product.id,
+                    "change_type": _change_type_for_field(record["field"]),
+                    "field_modified": record["field"],
+                    "old_value": record["old_value"],
+                    "new_value": record["new_value"],
+                    "modification_date": modification_date
+                }
+                for record in change_records
+            ])
+
+            # Cierra los tramos vigentes de los precios y costos modificados y abre los nuevos
+            price_records = [record for record in change_records if record["field"] in PRICE_HISTORY_FIELDS]
+            if price_records:
+                price_fields = [record["field"] for record in price_records]
+                # modification_date se tomó antes de obtener el bloqueo de escritura, así que otra modificación
+                # pudo confirmar un tramo posterior. Los tramos vigentes se leen aquí, ya dentro de la transacción,
+                # y el nuevo tramo nunca empieza antes que ellos (así los tramos no se superponen).
+                latest_from = session.query(func.max(PriceHistory.effective_from)).filter(
+                    PriceHistory.product_id == product.id,
+                    PriceHistory.field.in_(price_fields),
+                    PriceHistory.effective_to.is_(None)
+                ).scalar()
+                effective_from = modification_date if latest_from is None else max(modification_date, latest_from)
+                session.execute(
+                    update(PriceHistory)
+                    .where(
+                        PriceHistory.product_id == product.id,
+                        PriceHistory.field.in_(price_fields),
+                        PriceHistory.effective_to.is_(None)
+                    )
+                    .values(effective_to=effective_from)
                 )
-                session.add(new_modification)
+                session.execute(insert(PriceHistory), [
+                    {"product_id": product.id, "field": record["field"], "value": record["new_value"], "effective_from": effective_from}
+                    for record in price_records
+                ])
             
             session.commit()
+
+            # Si el cambio de stock o de stock mínimo dejó al producto en alerta, dispara el evento
+            if not was_low_stock and _is_low_stock(product.stock, product.min_stock):
+                _fire_stock_alert(product.id, product.name, product.stock, product.min_stock)
             return True, "Detalles del producto actualizados exitosamente."
         else:
             return False, "No se detectaron cambios para actualizar."
@@ -174,15 +291,145 @@ def update_product_details(product_id, new_prices, new_stock, new_min_stock, new
     finally:
         session.close()
 
-# Función para obtener el historial de modificaciones de inventario
-def get_inventory_modifications():
+# Obtiene el tipo de cambio del historial que corresponde a un campo del producto
+def _change_type_for_field(field):
+    if field.startswith("price_"):
+        return ChangeType.PRICE
+    return {"stock": ChangeType.STOCK, "min_stock": ChangeType.MIN_STOCK, "cost_price_box": ChangeType.COST}[field]
+
+# Función para obtener una página del historial de modificaciones de inventario
+# Retorna (filas, total), donde cada fila es (modificación, nombre del producto o None si fue eliminado)
+def get_inventory_modifications(page=1, page_size=AUDIT_PAGE_SIZE, product_id=None):
     session = get_db_session()
     try:
-        modifications = session.query(InventoryModification).order_by(InventoryModification.modification_date.desc()).all()
-        return modifications
+        query = session.query(InventoryModification, Product.name).outerjoin(Product, Product.id == InventoryModification.product_id)
+        if product_id is not None:
+            query = query.filter(InventoryModification.product_id == product_id)
+        total = query.count()
+        rows = (
+            query.order_by(InventoryModification.modification_date.desc(), InventoryModification.id.desc())
+            .offset((max(page, 1) - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+        return rows, total
+    finally:
+        session.close()
+
+# Función para aplicar la política de retención del historial de modificaciones
+# Las modificaciones anteriores al corte se agregan en inventory_audit_rollup (por producto, tipo, campo y mes)
+# y luego se eliminan, de modo que la tabla del historial se mantiene acotada.
+# Todo se hace en una sola transacción BEGIN IMMEDIATE (que toma el bloqueo de escritura desde el inicio),
+# así dos ejecuciones, incluso de procesos distintos, no pueden resumir las mismas filas dos veces.
+def apply_audit_retention(retention_days=AUDIT_RETENTION_DAYS, max_rows=AUDIT_MAX_ROWS):
+    with _audit_retention_run_lock:
+        return _apply_audit_retention(retention_days, max_rows)
+
+def _apply_audit_retention(retention_days, max_rows):
+    session = get_db_session()
+    try:
+        session.execute(text("BEGIN IMMEDIATE"))
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        # Si hay más filas que el máximo, el corte avanza hasta la fila número max_rows más reciente
+        # (se conservan esa fila y las más nuevas, es decir, max_rows filas salvo empates de fecha)
+        overflow_date = (
+            session.query(InventoryModification.modification_date)
+            .order_by(InventoryModification.modification_date.desc())
+            .offset(max(max_rows - 1, 0))
+            .limit(1)
+            .scalar()
+        )
+        if overflow_date is not None and overflow_date > cutoff:
+            cutoff = overflow_date
+
+        period = func.date(InventoryModification.modification_date, 'start of month')
+        groups = (
+            session.query(
+                InventoryModification.product_id,
+                InventoryModification.change_type,
+                InventoryModification.field_modified,
+                period,
+                func.count(InventoryModification.id),
+                func.coalesce(func.sum(InventoryModification.new_value - InventoryModification.old_value), 0.0),
+                func.min(InventoryModification.modification_date),
+                func.max(InventoryModification.modification_date),
+            )
+            .filter(InventoryModification.modification_date < cutoff)
+            .group_by(InventoryModification.product_id, InventoryModification.change_type, InventoryModification.field_modified, period)
+            .all()
+        )
+        if not groups:
+            return True, "No hay modificaciones fuera de la política de retención."
+
+        rolled_up = 0
+        for product_id, change_type, field, period_start, count, net_change, first_date, last_date in groups:
+            if change_type not in VALUE_CHANGE_TYPES:
+                net_change = 0.0 # Las eliminaciones solo se cuentan
+            period_start = datetime.strptime(period_start, "%Y-%m-%d").date()
+            rollup = session.query(InventoryModificationRollup).filter(
+                InventoryModificationRollup.product_id == product_id,
+                InventoryModificationRollup.change_type == change_type,
+                func.coalesce(InventoryModificationRollup.field_modified, '') == (field or ''),
+                InventoryModificationRollup.period_start == period_start
+            ).first()
+            if rollup is None:
+                rollup = InventoryModificationRollup(
+                    product_id=product_id, change_type=change_type, field_modified=field, period_start=period_start,
+                    change_count=0, net_change=0.0, first_date=first_date, last_date=last_date
+                )
+                session.add(rollup)
+            rollup.change_count += count
+            rollup.net_change += net_change
+            rollup.first_date = min(rollup.first_date, first_date)
+            rollup.last_date = max(rollup.last_date, last_date)
+            rolled_up += count
+
+        session.query(InventoryModification).filter(InventoryModification.modification_date < cutoff).delete(synchronize_session=False)
+        session.commit()
+        return True, f"{rolled_up} modificaciones antiguas resumidas y eliminadas del historial."
+    except Exception as e:
+        session.rollback()
+        return False, f"Error al aplicar la retención del historial: {e}"
     finally:
         session.close()
 
+# Aplica la política de retención y guarda el resultado para poder mostrarlo
+def run_audit_retention():
+    global _last_audit_retention
+    success, message = apply_audit_retention()
+    _last_audit_retention = (datetime.now(), success, message)
+    return success, message
+
+# Función para obtener el resultado de la última aplicación de la retención: (fecha, éxito, mensaje) o None
+def get_last_audit_retention():
+    return _last_audit_retention
+
+# Bucle del hilo de retención: la aplica al iniciar y luego cada interval_seconds
+def _audit_retention_loop(interval_seconds):
+    run_audit_retention()
+    while not _retention_stop.wait(interval_seconds):
+        run_audit_retention()
+
+# Inicia la aplicación periódica de la retención en un hilo en segundo plano (solo uno por proceso)
+def start_audit_retention_scheduler(interval_seconds=AUDIT_RETENTION_INTERVAL_SECONDS):
+    global _retention_thread
+    with _retention_lock:
+        if _retention_thread is not None and _retention_thread.is_alive():
+            return False
+        _retention_stop.clear()
+        _retention_thread = threading.Thread(target=_audit_retention_loop, args=(interval_seconds,), name="inventory-audit-retention", daemon=True)
+        _retention_thread.start()
+        return True
+
+# Detiene la aplicación periódica de la retención
+def stop_audit_retention_scheduler():
+    global _retention_thread
+    with _retention_lock:
+        _retention_stop.set()
+        if _retention_thread is not None:
+            _retention_thread.join()
+            _retention_thread = None
+
 # Función para obtener el inventario actual (productos con stock actualizado)
 def get_current_inventory():
     session = get_db_session() # Obtiene una nueva sesión de base de datos
@@ -193,6 +440,196 @@ def get_current_inventory():
     finally:
         session.close() # Cierra la sesión de la base de datos
 
+# Función para obtener solo los productos en alerta de stock bajo
+# Lee la tabla stock_alerts mantenida por triggers, por lo que su costo depende del número de alertas
+def get_stock_alerts():
+    session = get_db_session()
+    try:
+        alerts = (
+            session.query(StockAlert)
+            .options(joinedload(StockAlert.product))
+            .order_by(StockAlert.alert_date.desc())
+            .all()
+        )
+        return alerts
+    finally:
+        session.close()
+
+# Función para obtener la matriz de precios de todos los productos
+# Retorna un DataFrame indexado por (product_id, price_type) con las columnas:
+# product_name, price (precio del paquete), units (unidades por paquete),
+# unit_price (precio por unidad) y unit_cost (costo por unidad)
+def get_price_matrix():
+    global _price_matrix_cache
+    # La versión se lee antes de consultar: si cambia durante la consulta, el próximo uso recalcula
+    catalog_version = get_catalog_version()
+    if _price_matrix_cache is not None and _price_matrix_cache[0] == catalog_version:
+        return _price_matrix_cache[1]
+
+    session = get_db_session()
+    try:
+        products = session.query(
+            Product.id, Product.name, Product.units_per_box, Product.cost_price_box,
+            *[getattr(Product, column) for column, _ in PRICE_TYPES.values()]
+        ).all()
+    finally:
+        session.close()
+
+    catalog = pd.DataFrame(products, columns=["product_id", "product_name", "units_per_box", "cost_price_box"] + [column for column, _ in PRICE_TYPES.values()])
+    # Si units_per_box no es válido se toma la caja como una unidad (igual que calculate_profit_per_type)
+    units_per_box = catalog["units_per_box"].where(catalog["units_per_box"] > 0, 1)
+    unit_cost = catalog["cost_price_box"] / units_per_box
+
+    frames = []
+    for price_type, (column, units) in PRICE_TYPES.items():
+        package_units = units_per_box if units is None else pd.Series(units, index=catalog.index)
+        frames.append(pd.DataFrame({
+            "product_id": catalog["product_id"],
+            "price_type": price_type,
+            "product_name": catalog["product_name"],
+            "price": catalog[column],
+            "units": package_units.astype(int),
+            "unit_price": catalog[column] / package_units,
+            "unit_cost": unit_cost,
+        }))
+    matrix = pd.concat(frames, ignore_index=True).set_index(["product_id", "price_type"]).sort_index()
+    _price_matrix_cache = (catalog_version, matrix)
+    return matrix
+
+# Función para cotizar una canasta completa en una sola operación vectorizada
+# lines es una lista de dicts con product_id, price_type, quantity (paquetes) y opcionalmente discount.
+# Retorna un DataFrame con una fila por línea: price (precio del paquete), units_sold, unit_price,
+# unit_cost, subtotal, discount, total y profit. Lanza ValueError si algún producto o tipo de precio no existe.
+def quote(lines):
+    basket = pd.DataFrame(list(lines), columns=["product_id", "price_type", "quantity", "discount"])
+    basket["discount"] = basket["discount"].fillna(0)
+    priced = basket.join(get_price_matrix(), on=["product_id", "price_type"])
+
+    missing = priced["price"].isna()
+    if missing.any():
+        first = priced[missing].iloc[0]
+        raise ValueError(f"Producto {first['product_id']} o tipo de precio '{first['price_type']}' no encontrado.")
+
+    priced["units_sold"] = priced["quantity"] * priced["units"]
+    priced["subtotal"] = priced["price"] * priced["quantity"]
+    priced["total"] = (priced["subtotal"] - priced["discount"]).clip(lower=0)
+    priced["profit"] = priced["total"] - priced["unit_cost"] * priced["units_sold"]
+    return priced
+
+# Función para obtener el resumen de ventas por tipo de precio (ventas antiguas sin tipo aparecen como None)
+def get_sales_by_price_type():
+    session = get_db_session()
+    try:
+        rows = (
+            session.query(
+                Sale.price_type,
+                func.count(Sale.id),
+                func.coalesce(func.sum(Sale.quantity), 0),
+                func.coalesce(func.sum(Sale.total_price), 0.0),
+                func.coalesce(func.sum(Sale.cost_price_at_sale * Sale.quantity), 0.0),
+            )
+            .group_by(Sale.price_type)
+            .all()
+        )
+        return rows
+    finally:
+        session.close()
+
+# Condición de rango: el tramo de historial que estaba vigente en la fecha dada
+def _price_history_in_effect(history, date):
+    return and_(
+        history.effective_from <= date,
+        or_(history.effective_to.is_(None), history.effective_to > date)
+    )
+
+# Subconsulta con el id del tramo vigente en la fecha dada para un producto y campo.
+# Si hay tramos superpuestos (por ejemplo, historial registrado antes de evitarlos) gana el que empezó más tarde.
+def _price_history_segment_id(product_id, field, date):
+    history = aliased(PriceHistory)
+    return (
+        select(history.id)
+        .where(history.product_id == product_id, history.field == field, _price_history_in_effect(history, date))
+        .order_by(history.effective_from.desc(), history.id.desc())
+        .limit(1)
+        .correlate_except(history)
+        .scalar_subquery()
+    )
+
+# Función para obtener los precios y el costo vigentes de varios productos en una fecha
+# Retorna un DataFrame indexado por product_id con una columna por campo de PRICE_HISTORY_FIELDS
+# (NaN si el campo aún no tenía valor en esa fecha). Si product_ids es None se incluyen todos los productos.
+def get_prices_as_of(date, product_ids=None):
+    session = get_db_session()
+    try:
+        query = session.query(PriceHistory.id, PriceHistory.product_id, PriceHistory.field, PriceHistory.value, PriceHistory.effective_from).filter(
+            _price_history_in_effect(PriceHistory, date)
+        )
+        if product_ids is not None:
+            query = query.filter(PriceHistory.product_id.in_(list(product_ids)))
+        rows = query.all()
+    finally:
+        session.close()
+
+    history = pd.DataFrame(rows, columns=["id", "product_id", "field", "value", "effective_from"])
+    # Si hay tramos superpuestos se toma el que empezó más tarde (igual que recalculate_historical_margins)
+    history = history.sort_values(["effective_from", "id"]).drop_duplicates(["product_id", "field"], keep="last")
+    prices = history.pivot(index="product_id", columns="field", values="value")
+    return prices.reindex(columns=list(PRICE_HISTORY_FIELDS))
+
+# Función para obtener los precios y el costo de un producto en una fecha dada
+# Retorna un dict con cada campo de PRICE_HISTORY_FIELDS y unit_cost (costo por unidad),
+# o None si el producto no tenía historial en esa fecha.
+def as_of(product_id, date):
+    prices = get_prices_as_of(date, [product_id])
+    if product_id not in prices.index:
+        return None
+    values = {field: (None if pd.isna(value) else float(value)) for field, value in prices.loc[product_id].items()}
+
+    product = get_product_by_id(product_id)
+    units_per_box = product.units_per_box if product is not None and product.units_per_box and product.units_per_box > 0 else 1
+    values["unit_cost"] = None if values["cost_price_box"] is None else values["cost_price_box"] / units_per_box
+    return values
+
+# Función para recalcular el margen de las ventas con el costo vigente en la fecha de cada venta
+# Une ventas e historial de precios por rango de fechas en una sola consulta.
+# Retorna un DataFrame con una fila por venta: sale_id, sale_date, product_id, product_name, price_type,
+# quantity, total_price, list_price (precio de lista del paquete vigente, si se conoce el tipo de precio),
+# historical_unit_cost, historical_margin, recorded_unit_cost y recorded_margin (con el costo guardado en la venta).
+def recalculate_historical_margins(start=None, end=None):
+    cost = aliased(PriceHistory)
+    list_price = aliased(PriceHistory)
+    # Campo del historial que corresponde al tipo de precio de cada venta
+    price_field = case({price_type: column for price_type, (column, _) in PRICE_TYPES.items()}, value=Sale.price_type)
+
+    session = get_db_session()
+    try:
+        query = (
+            session.query(
+                Sale.id, Sale.sale_date, Sale.product_id, Product.name, Product.units_per_box, Sale.price_type,
+                Sale.quantity, Sale.total_price, Sale.cost_price_at_sale, cost.value, list_price.value
+            )
+            .outerjoin(Product, Product.id == Sale.product_id)
+            .outerjoin(cost, cost.id == _price_history_segment_id(Sale.product_id, "cost_price_box", Sale.sale_date))
+            .outerjoin(list_price, list_price.id == _price_history_segment_id(Sale.product_id, price_field, Sale.sale_date))
+        )
+        if start is not None:
+            query = query.filter(Sale.sale_date >= start)
+        if end is not None:
+            query = query.filter(Sale.sale_date < end)
+        rows = query.order_by(Sale.sale_date, Sale.id).all()
+    finally:
+        session.close()
+
+    margins = pd.DataFrame(rows, columns=[
+        "sale_id", "sale_date", "product_id", "product_name", "units_per_box", "price_type",
+        "quantity", "total_price", "recorded_unit_cost", "cost_price_box", "list_price"
+    ])
+    units_per_box = margins["units_per_box"].where(margins["units_per_box"] > 0, 1)
+    margins["historical_unit_cost"] = margins["cost_price_box"] / units_per_box
+    margins["historical_margin"] = margins["total_price"] - margins["historical_unit_cost"] * margins["quantity"]
+    margins["recorded_margin"] = margins["total_price"] - margins["recorded_unit_cost"] * margins["quantity"]
+    return margins.drop(columns=["units_per_box", "cost_price_box"])
+
 # Función para calcular la ganancia por tipo de precio (potencial, no por venta real)
 def calculate_profit_per_type(product):
     profits = {}
@@ -250,9 +687,9 @@ def delete_product(product_id):
         # Registrar la eliminación en el historial de modificaciones
         new_modification = InventoryModification(
             product_id=product.id,
-            field_modified="product_deletion",
-            old_value=f"Producto: {product.name}, ID: {product.id}",
-            new_value="ELIMINADO",
+            change_type=ChangeType.PRODUCT_DELETION,
+            old_value=product.stock, # Stock que tenía el producto al eliminarse
+            note=product.name, # El nombre se conserva porque el producto deja de existir
             modification_date=datetime.now()
         )
         session.add(new_modification)
@@ -275,20 +712,20 @@ def delete_sale(sale_id):
         if not sale:
             return False, "Error: Venta no encontrada."
 
-        # Obtener el producto asociado para el registro de historial
-        product = get_product_by_id(sale.product_id)
-        product_name = product.name if product else "Desconocido"
-
         # Registrar la eliminación en el historial de modificaciones
         new_modification = InventoryModification(
             product_id=sale.product_id, # Usar el ID del producto asociado a la venta
-            field_modified="sale_deletion",
-            old_value=f"Venta ID: {sale.id}, Producto: {product_name}, Cantidad: {sale.quantity}, Total: {sale.total_price}",
-            new_value="ELIMINADA",
+            change_type=ChangeType.SALE_DELETION,
+            quantity=sale.quantity, # Cantidad de unidades de la venta eliminada
+            amount=sale.total_price, # Total de la venta eliminada
+            reference_id=sale.id, # ID de la venta eliminada
             modification_date=datetime.now()
         )
         session.add(new_modification)
 
+        # Si la venta pertenece a un día ya cerrado, se invalida ese cierre
+        _invalidate_daily_close(session, sale.sale_date)
+
         # Eliminar la venta
         session.delete(sale)
         session.commit()
@@ -298,3 +735,111 @@ def delete_sale(sale_id):
         return False, f"Error al eliminar venta: {e}"
     finally:
         session.close()
+
+# Elimina el cierre de caja del día de sale_date, si existe (dentro de la transacción de la sesión dada)
+def _invalidate_daily_close(session, sale_date):
+    if sale_date is None:
+        return
+    daily_close = session.query(DailyClose).filter_by(close_date=sale_date.date()).first()
+    if daily_close:
+        session.delete(daily_close)
+
+# Marca como desactualizado el cierre del día de una venta nueva, sin borrar las cifras guardadas
+# Retorna True si el día estaba cerrado
+def _mark_daily_close_stale(session, sale_date):
+    daily_close = session.query(DailyClose).filter_by(close_date=sale_date.date()).first()
+    if daily_close is None:
+        return False
+    daily_close.is_stale = True
+    return True
+
+# Calcula las cifras de un día con una sola consulta por rango sobre el índice de sales.sale_date
+def _compute_daily_close(session, day):
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    rows = (
+        session.query(
+            Sale.product_id,
+            Product.name,
+            func.count(Sale.id),
+            func.coalesce(func.sum(Sale.quantity), 0),
+            func.coalesce(func.sum(Sale.unit_price_at_sale * Sale.quantity), 0.0),
+            func.coalesce(func.sum(Sale.discount), 0.0),
+            func.coalesce(func.sum(Sale.total_price), 0.0),
+            func.coalesce(func.sum(Sale.cost_price_at_sale * Sale.quantity), 0.0),
+        )
+        .outerjoin(Product, Product.id == Sale.product_id)
+        .filter(Sale.sale_date >= day_start, Sale.sale_date < day_end)
+        .group_by(Sale.product_id, Product.name)
+        .all()
+    )
+
+    daily_close = DailyClose(close_date=day, closed_at=datetime.now())
+    totals = {"sales_count": 0, "units": 0, "gross_revenue": 0.0, "discounts": 0.0, "net_revenue": 0.0, "cost": 0.0}
+    for product_id, product_name, sales_count, units, gross_revenue, discounts, net_revenue, cost in rows:
+        daily_close.items.append(DailyCloseItem(
+            product_id=product_id,
+            product_name=product_name or "Desconocido",
+            sales_count=sales_count,
+            units=units,
+            gross_revenue=gross_revenue,
+            discounts=discounts,
+            net_revenue=net_revenue,
+            cost=cost,
+            profit=net_revenue - cost
+        ))
+        totals["sales_count"] += sales_count
+        totals["units"] += units
+        totals["gross_revenue"] += gross_revenue
+        totals["discounts"] += discounts
+        totals["net_revenue"] += net_revenue
+        totals["cost"] += cost
+
+    for field, value in totals.items():
+        setattr(daily_close, field, value)
+    daily_close.profit = totals["net_revenue"] - totals["cost"]
+    return daily_close
+
+# Función para hacer el cierre de caja de un día (por defecto, hoy)
+# El resultado se guarda y no se vuelve a calcular mientras no cambien las ventas de ese día;
+# un cierre marcado como desactualizado se reemplaza por uno nuevo
+def close_day(day=None):
+    day = day or datetime.now().date()
+    if day > datetime.now().date():
+        return False, "Error: No se puede cerrar la caja de un día futuro."
+
+    session = get_db_session()
+    try:
+        existing_close = session.query(DailyClose).filter_by(close_date=day).first()
+        if existing_close:
+            if not existing_close.is_stale:
+                return False, f"La caja del {day.strftime('%Y-%m-%d')} ya está cerrada."
+            session.delete(existing_close)
+            session.flush()
+
+        daily_close = _compute_daily_close(session, day)
+        session.add(daily_close)
+        session.commit()
+        return True, f"Cierre de caja del {day.strftime('%Y-%m-%d')} registrado exitosamente."
+    except IntegrityError:
+        session.rollback() # Otro usuario cerró el mismo día al mismo tiempo
+        return False, f"La caja del {day.strftime('%Y-%m-%d')} ya está cerrada."
+    except Exception as e:
+        session.rollback()
+        return False, f"Error al cerrar la caja: {e}"
+    finally:
+        session.close()
+
+# Función para obtener el cierre de caja guardado de un día, o None si el día no está cerrado
+def get_daily_close(day):
+    session = get_db_session()
+    try:
+        daily_close = (
+            session.query(DailyClose)
+            .options(joinedload(DailyClose.items))
+            .filter_by(close_date=day)
+            .first()
+        )
+        return daily_close
+    finally:
+        session.close()
\ No newline at end of file
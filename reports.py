@@ -0,0 +1,362 @@
+# reports.py
+# Ejecución de reportes y exportaciones fuera del hilo de Streamlit.
+# Los reportes corren en un ProcessPoolExecutor con conexiones de solo lectura a la base de datos,
+# informan su progreso, y sus resultados se guardan en caché según los parámetros y la versión
+# de los datos, de modo que los reportes largos no bloquean la interfaz ni las ventas.
+#
+# Este módulo no importa db.py ni main.py a nivel de módulo: los procesos de trabajo lo importan
+# y no deben crear tablas ni escribir en la base de datos.
+import multiprocessing
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+# Cantidad máxima de reportes ejecutándose al mismo tiempo
+REPORT_MAX_WORKERS = 2
+# Segundos máximos de espera para que arranquen los procesos de trabajo
+REPORT_POOL_START_TIMEOUT = 60
+# Cantidad de resultados de reportes que se mantienen en caché
+REPORT_CACHE_SIZE = 16
+# Filas leídas por lote (cada lote actualiza el progreso)
+REPORT_CHUNK_SIZE = 5000
+
+# Estados de un trabajo
+JOB_PENDING = "pendiente"
+JOB_RUNNING = "en curso"
+JOB_DONE = "listo"
+JOB_FAILED = "error"
+
+
+# Función para formatear números para Excel en español
+def format_number_for_excel_es(value):
+    """
+    Formatea un número a una cadena de texto adecuada para Excel en español,
+    usando '.' como separador de miles y ',' como separador decimal.
+    Maneja valores None/no numéricos de forma segura.
+    """
+    if value is None or not isinstance(value, (int, float)):
+        return str(value) # Retorna como cadena si no es un número
+
+    # Manejar el signo negativo
+    sign = "-" if value < 0 else ""
+    abs_value = abs(value)
+
+    # Formatear a 2 decimales primero (ej. 1234.56)
+    s_value = f"{abs_value:.2f}"
+
+    # Dividir en parte entera y fraccionaria
+    parts = s_value.split('.')
+    integer_part = parts[0]
+    decimal_part = parts[1] if len(parts) > 1 else "00"
+
+    # Añadir separadores de miles a la parte entera
+    formatted_integer_part = []
+    for i, digit in enumerate(reversed(integer_part)):
+        formatted_integer_part.append(digit)
+        if (i + 1) % 3 == 0 and (i + 1) != len(integer_part):
+            formatted_integer_part.append('.')
+    formatted_integer_part = "".join(reversed(formatted_integer_part))
+
+    return f"{sign}{formatted_integer_part},{decimal_part}"
+
+
+# Función para convertir un DataFrame a formato Excel
+def to_excel(df):
+    output = BytesIO() # Crea un objeto BytesIO en memoria
+    writer = pd.ExcelWriter(output, engine='xlsxwriter') # Crea un escritor de Excel
+    df.to_excel(writer, index=False, sheet_name='Sheet1') # Escribe el DataFrame al Excel
+    writer.close() # Cierra el escritor
+    processed_data = output.getvalue() # Obtiene los datos del Excel
+    return processed_data # Retorna los datos
+
+
+# --- Reportes (se ejecutan en los procesos de trabajo) ---
+# Cada reporte recibe una conexión de solo lectura, sus parámetros y una función progress(fracción),
+# y retorna un diccionario con el DataFrame ("data") y el archivo Excel ("excel").
+
+# Lee una consulta por lotes, del registro más reciente al más antiguo, actualizando el progreso
+# entre 0 y max_progress. Cada lote es una consulta independiente (paginación por clave sobre la
+# fecha y el id), así el bloqueo de lectura se libera entre lotes y las ventas pueden confirmar.
+# Los filtros y el orden usan las columnas de la tabla (ej. s.sale_date y s.id) para que cada lote
+# recorra el índice de la fecha en lugar de ordenar toda la tabla; los registros sin fecha se leen al final.
+# select_sql debe seleccionar las columnas de fecha e id con su nombre y no llevar WHERE ni ORDER BY.
+def _read_in_chunks(connection, select_sql, date_column, id_column, total, progress, max_progress):
+    order_by = f"ORDER BY {date_column} DESC, {id_column} DESC LIMIT ?"
+    date_key = date_column.split(".")[-1]
+    id_key = id_column.split(".")[-1]
+    # Para los registros con fecha y luego para los que no la tienen: (consulta del primer lote, consulta de los siguientes)
+    passes = [
+        (
+            (f"{select_sql} WHERE {date_column} IS NOT NULL {order_by}", lambda last: ()),
+            # (fecha, id) < (última fecha, último id), escrito como rango sobre el índice de la fecha
+            (f"{select_sql} WHERE {date_column} <= ? AND ({date_column} < ? OR {id_column} < ?) {order_by}",
+             lambda last: (last[date_key], last[date_key], int(last[id_key]))),
+        ),
+        (
+            (f"{select_sql} WHERE {date_column} IS NULL {order_by}", lambda last: ()),
+            (f"{select_sql} WHERE {date_column} IS NULL AND {id_column} < ? {order_by}", lambda last: (int(last[id_key]),)),
+        ),
+    ]
+
+    chunks = []
+    read = 0
+    for first_query, next_query in passes:
+        sql, params = first_query
+        last = None
+        while True:
+            chunk = pd.read_sql_query(sql, connection, params=(*params(last), REPORT_CHUNK_SIZE))
+            if not chunk.empty:
+                chunks.append(chunk)
+                read += len(chunk)
+                progress(max_progress * min(read / total, 1.0) if total else max_progress)
+            if len(chunk) < REPORT_CHUNK_SIZE:
+                break
+            last = chunk.iloc[-1]
+            sql, params = next_query
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+# Aplica format_number_for_excel_es a una columna numérica (los valores vacíos quedan en blanco)
+def _format_numbers(series):
+    return series.astype(float).map(lambda value: "" if pd.isna(value) else format_number_for_excel_es(value))
+
+# Historial de ventas con la ganancia de cada venta
+def _report_sales_history(connection, params, progress):
+    total = connection.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+    sales = _read_in_chunks(
+        connection,
+        "SELECT s.id, COALESCE(p.name, 'Desconocido') AS product_name, s.quantity, "
+        "s.unit_price_at_sale, s.cost_price_at_sale, s.discount, s.total_price, s.price_type, s.sale_date "
+        "FROM sales s LEFT JOIN products p ON p.id = s.product_id",
+        "s.sale_date",
+        "s.id",
+        total,
+        progress,
+        0.6,
+    )
+    if sales.empty:
+        progress(1.0)
+        return {"data": sales, "excel": None}
+
+    # Ganancia = (Precio Unitario de Venta - Costo Unitario al Momento de la Venta) * Cantidad Total de Unidades Vendidas
+    profit = (sales["unit_price_at_sale"] - sales["cost_price_at_sale"]) * sales["quantity"]
+    df_sales = pd.DataFrame({
+        "ID Venta": sales["id"],
+        "Producto": sales["product_name"],
+        "Tipo de Precio": sales["price_type"].fillna("Sin registrar"),
+        "Cantidad": sales["quantity"],
+        "Precio Unitario Venta": _format_numbers(sales["unit_price_at_sale"]),
+        "Costo Unitario Venta": _format_numbers(sales["cost_price_at_sale"]),
+        "Descuento": _format_numbers(sales["discount"]),
+        "Precio Total": _format_numbers(sales["total_price"]),
+        "Ganancia Venta": _format_numbers(profit),
+        "Fecha Venta": pd.to_datetime(sales["sale_date"], format="ISO8601").dt.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    progress(0.8)
+    excel = to_excel(df_sales)
+    progress(1.0)
+    return {"data": df_sales, "excel": excel}
+
+# Historial completo de modificaciones de inventario (la pestaña lo muestra paginado)
+def _report_modifications_history(connection, params, progress):
+    total = connection.execute("SELECT COUNT(*) FROM inventory_audit").fetchone()[0]
+    modifications = _read_in_chunks(
+        connection,
+        "SELECT a.id, COALESCE(p.name, a.note, 'Desconocido') AS product_name, "
+        "a.change_type, a.field_modified, a.old_value, a.new_value, a.reference_id, a.quantity, a.amount, a.modification_date "
+        "FROM inventory_audit a LEFT JOIN products p ON p.id = a.product_id",
+        "a.modification_date",
+        "a.id",
+        total,
+        progress,
+        0.7,
+    )
+    if modifications.empty:
+        progress(1.0)
+        return {"data": modifications, "excel": None}
+
+    df_modifications = pd.DataFrame({
+        "ID Modificación": modifications["id"],
+        "Producto": modifications["product_name"],
+        "Tipo de Cambio": modifications["change_type"],
+        "Campo Modificado": modifications["field_modified"].fillna(""),
+        "Valor Anterior": _format_numbers(modifications["old_value"]),
+        "Nuevo Valor": _format_numbers(modifications["new_value"]),
+        "Referencia": modifications["reference_id"].map(lambda value: "" if pd.isna(value) else str(int(value))),
+        "Cantidad": modifications["quantity"].map(lambda value: "" if pd.isna(value) else str(int(value))),
+        "Total": _format_numbers(modifications["amount"]),
+        "Fecha Modificación": pd.to_datetime(modifications["modification_date"], format="ISO8601").dt.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    progress(0.85)
+    excel = to_excel(df_modifications)
+    progress(1.0)
+    return {"data": df_modifications, "excel": excel}
+
+REPORTS = {
+    "sales_history": _report_sales_history,
+    "modifications_history": _report_modifications_history,
+}
+
+
+# Punto de entrada de los procesos de trabajo
+def _run_report(report_name, params, database_path, job_id, progress_store):
+    def progress(fraction):
+        progress_store[job_id] = min(max(float(fraction), 0.0), 1.0)
+
+    progress(0.0)
+    # Conexión de solo lectura: el reporte nunca toma bloqueos de escritura
+    connection = sqlite3.connect(f"file:{os.path.abspath(database_path)}?mode=ro", uri=True)
+    try:
+        return REPORTS[report_name](connection, params, progress)
+    finally:
+        connection.close()
+
+
+# --- Administración de trabajos (en el proceso de la aplicación) ---
+
+_lock = threading.Lock()
+_executor = None
+_manager = None
+_progress_store = None
+_jobs = {}
+# Clave (reporte, parámetros, versión de datos) -> ID del trabajo, de la más antigua a la más reciente
+_job_cache = OrderedDict()
+
+
+# Tarea de arranque: cada proceso de trabajo espera hasta que todos estén iniciados
+def _wait_for_all_workers(barrier):
+    barrier.wait(REPORT_POOL_START_TIMEOUT)
+
+
+# Función para iniciar el pool de procesos de reportes. run_app.py la llama una sola vez, antes de
+# iniciar Streamlit: los procesos 'spawn' vuelven a importar el módulo __main__ del proceso padre, y
+# Streamlit registra ui.py como __main__ al ejecutar el script. Todos los procesos se inician aquí
+# (cada tarea de arranque ocupa un proceso hasta que todos existen), así el pool no crea procesos después.
+def start_report_pool(max_workers=REPORT_MAX_WORKERS):
+    global _executor, _manager, _progress_store
+    with _lock:
+        if _executor is not None:
+            return False
+        # 'spawn' evita que los procesos hereden las conexiones SQLite y los hilos de la aplicación
+        context = multiprocessing.get_context("spawn")
+        _manager = context.Manager()
+        _progress_store = _manager.dict()
+        _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        barrier = _manager.Barrier(max_workers)
+        wait([_executor.submit(_wait_for_all_workers, barrier) for _ in range(max_workers)])
+        return True
+
+
+# Obtiene el ejecutor de reportes. Si no se inició el pool de procesos (por ejemplo, al ejecutar
+# 'streamlit run ui.py' en lugar de run_app.py), los reportes corren en hilos de este proceso.
+def _ensure_executor():
+    global _executor, _progress_store
+    if _executor is None:
+        _progress_store = {}
+        _executor = ThreadPoolExecutor(max_workers=REPORT_MAX_WORKERS, thread_name_prefix="inventory-report")
+    return _executor
+
+
+# Función para solicitar un reporte; retorna el ID del trabajo
+# Si ya hay un trabajo con los mismos parámetros y los datos no cambiaron, se reutiliza su resultado.
+def submit_report(report_name, **params):
+    if report_name not in REPORTS:
+        raise ValueError(f"Reporte desconocido: '{report_name}'.")
+    from db import DATABASE_PATH, get_data_version # Import diferido: solo el proceso de la aplicación usa db.py
+
+    with _lock:
+        key = (report_name, tuple(sorted(params.items())), get_data_version())
+        job_id = _job_cache.get(key)
+        if job_id is not None:
+            future = _jobs[job_id]["future"]
+            # Un trabajo que falló se vuelve a ejecutar; uno pendiente, en curso o listo se reutiliza
+            if not (future.done() and (future.cancelled() or future.exception() is not None)):
+                _job_cache.move_to_end(key)
+                return job_id
+            # El trabajo fallido se descarta antes de crear el nuevo, para no dejarlo sin referencia en _jobs
+            del _job_cache[key]
+            _jobs.pop(job_id, None)
+            _progress_store.pop(job_id, None)
+
+        # Los trabajos del mismo reporte sobre una versión anterior de los datos que aún no empezaron ya no sirven
+        for old_key, old_job_id in list(_job_cache.items()):
+            if old_key[:2] == key[:2] and _jobs[old_job_id]["future"].cancel():
+                del _job_cache[old_key]
+                _jobs.pop(old_job_id, None)
+                _progress_store.pop(old_job_id, None)
+
+        executor = _ensure_executor()
+        job_id = uuid.uuid4().hex
+        _progress_store[job_id] = 0.0
+        _jobs[job_id] = {
+            "id": job_id,
+            "report": report_name,
+            "params": params,
+            "submitted_at": datetime.now(),
+            "future": None,
+        }
+        try:
+            _jobs[job_id]["future"] = executor.submit(_run_report, report_name, params, DATABASE_PATH, job_id, _progress_store)
+        except Exception:
+            _jobs.pop(job_id, None)
+            _progress_store.pop(job_id, None)
+            raise
+        _job_cache[key] = job_id
+        # Descarta los resultados más antiguos de la caché
+        while len(_job_cache) > REPORT_CACHE_SIZE:
+            _, old_job_id = _job_cache.popitem(last=False)
+            _jobs.pop(old_job_id, None)
+            _progress_store.pop(old_job_id, None)
+        return job_id
+
+
+# Función para consultar el estado de un trabajo
+# Retorna un diccionario con status, progress, result (si terminó) y error (si falló), o None si no existe
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        future = job["future"]
+        status = {
+            "id": job_id,
+            "report": job["report"],
+            "params": job["params"],
+            "submitted_at": job["submitted_at"],
+            "progress": _progress_store.get(job_id, 0.0),
+            "result": None,
+            "error": None,
+        }
+    if future.cancelled():
+        status.update(status=JOB_FAILED, error="El reporte fue cancelado.")
+    elif future.done():
+        error = future.exception()
+        if error is None:
+            status.update(status=JOB_DONE, progress=1.0, result=future.result())
+        else:
+            status.update(status=JOB_FAILED, error=str(error))
+    else:
+        status["status"] = JOB_RUNNING if future.running() else JOB_PENDING
+    return status
+
+
+# Función para obtener el último trabajo terminado de un reporte con estos parámetros, sobre cualquier
+# versión de los datos, o None si no hay ninguno. Sirve para seguir mostrando el último resultado
+# mientras se genera uno nuevo.
+def get_last_finished_job(report_name, **params):
+    with _lock:
+        candidates = [
+            job_id for key, job_id in reversed(_job_cache.items())
+            if key[:2] == (report_name, tuple(sorted(params.items())))
+        ]
+    for job_id in candidates:
+        job = get_job(job_id)
+        if job is not None and job["status"] == JOB_DONE:
+            return job
+    return None
\ No newline at end of file
@@ -1,11 +1,13 @@
 # run_app.py
 import sys
 import os
+import multiprocessing
 
 # Importa la función principal de Streamlit directamente.
 # Si esta importación falla, PyInstaller no ha empaquetado Streamlit correctamente.
 # La excepción será capturada por el bloque try-except general.
 from streamlit.web.cli import main as streamlit_main
+from reports import start_report_pool
 
 def run_streamlit_app():
     """
@@ -37,5 +39,9 @@ def run_streamlit_app():
         sys.argv = original_argv
 
 if __name__ == "__main__":
+    # Necesario para que los procesos de reportes (reports.py) funcionen en el ejecutable de PyInstaller
+    multiprocessing.freeze_support()
+    # Inicia los procesos de reportes antes que Streamlit, mientras el módulo __main__ es este archivo
+    start_report_pool()
     # Asegura que la función se ejecute solo cuando el script es llamado directamente
     run_streamlit_app()
@@ -2,50 +2,28 @@
 import streamlit as st
 import pandas as pd
 # Asegúrate de importar todas las funciones necesarias
-from main import add_product, get_all_products, record_sale, get_all_sales, get_product_by_id, get_current_inventory, update_product_details, get_inventory_modifications, calculate_profit_per_type, delete_product, delete_sale
-from io import BytesIO
-
-# Nueva función para formatear números para Excel en español
-def format_number_for_excel_es(value):
-    """
-    Formatea un número a una cadena de texto adecuada para Excel en español,
-    usando '.' como separador de miles y ',' como separador decimal.
-    Maneja valores None/no numéricos de forma segura.
-    """
-    if value is None or not isinstance(value, (int, float)):
-        return str(value) # Retorna como cadena si no es un número
-
-    # Manejar el signo negativo
-    sign = "-" if value < 0 else ""
-    abs_value = abs(value)
-
-    # Formatear a 2 decimales primero (ej. 1234.56)
-    s_value = f"{abs_value:.2f}"
-    
-    # Dividir en parte entera y fraccionaria
-    parts = s_value.split('.')
-    integer_part = parts[0]
-    decimal_part = parts[1] if len(parts) > 1 else "00"
-
-    # Añadir separadores de miles a la parte entera
-    formatted_integer_part = []
-    for i, digit in enumerate(reversed(integer_part)):
-        formatted_integer_part.append(digit)
-        if (i + 1) % 3 == 0 and (i + 1) != len(integer_part):
-            formatted_integer_part.append('.')
-    formatted_integer_part = "".join(reversed(formatted_integer_part))
-
-    return f"{sign}{formatted_integer_part},{decimal_part}"
-
-
-# Función para convertir un DataFrame a formato Excel
-def to_excel(df):
-    output = BytesIO() # Crea un objeto BytesIO en memoria
-    writer = pd.ExcelWriter(output, engine='xlsxwriter') # Crea un escritor de Excel
-    df.to_excel(writer, index=False, sheet_name='Sheet1') # Escribe el DataFrame al Excel
-    writer.close() # Cierra el escritor
-    processed_data = output.getvalue() # Obtiene los datos del Excel
-    return processed_data # Retorna los datos
+from main import add_product, get_all_products, record_sale, get_product_by_id, get_current_inventory, update_product_details, get_inventory_modifications, calculate_profit_per_type, delete_product, delete_sale, get_stock_alerts, close_day, get_daily_close, quote, get_sales_by_price_type, as_of, run_audit_retention, get_last_audit_retention, start_audit_retention_scheduler, PRICE_TYPES
+from db import ChangeType
+from backup import create_backup, list_backups, restore_backup, start_backup_scheduler
+from reports import format_number_for_excel_es, to_excel, submit_report, get_job, get_last_finished_job, JOB_DONE, JOB_FAILED
+from datetime import datetime
+
+# Inicia los respaldos automáticos en segundo plano (solo se crea un hilo por proceso)
+start_backup_scheduler()
+# Inicia la aplicación periódica de la retención del historial de modificaciones
+start_audit_retention_scheduler()
+
+# Segundos entre consultas del estado de un reporte en curso
+REPORT_POLL_SECONDS = 1
+
+# Muestra el progreso de un reporte en curso. Solo este fragmento se vuelve a ejecutar mientras el
+# reporte se genera; cuando termina (o falla) se recarga la página para mostrar el resultado.
+@st.fragment(run_every=REPORT_POLL_SECONDS)
+def show_report_progress(job_id, label):
+    job = get_job(job_id)
+    if job is None or job["status"] in (JOB_DONE, JOB_FAILED):
+        st.rerun()
+    st.progress(job["progress"], text=f"{label} ({job['status']})...")
 
 # Título principal de la aplicación
 st.set_page_config(layout="wide") # Configura el diseño de la página para que sea ancho
@@ -144,11 +122,8 @@ with tab2:
 
         selected_product_id = product_names[selected_product_name] if selected_product_name else None
         
-        # Obtiene el objeto producto completo para acceder a sus precios y unidades por caja
-        current_product = get_product_by_id(selected_product_id) if selected_product_id else None
-
-        # Selector de tipo de precio
-        price_types = ["Caja Fria", "Caja Caliente", "Caja Particular", "six-pack", "Unitario"]
+        # Selector de tipo de precio (los mismos tipos que usa el motor de precios de main.py)
+        price_types = list(PRICE_TYPES.keys())
         selected_price_type = st.selectbox("Tipo de Precio", price_types, key="sale_price_type_select")
 
         # Determine the label for the quantity input based on the selected price type
@@ -169,44 +144,20 @@ with tab2:
         quantity_for_sale_record = 0 # Cantidad total de unidades individuales vendidas
         unit_price_for_sale_record = 0.0 # Precio por unidad individual para almacenar en el registro de venta
 
-        if current_product:
-            # Calcular el costo por unidad basado en el 'Valor Caja' del producto
-            current_cost_per_unit = 0.0
-            if current_product.units_per_box > 0:
-                current_cost_per_unit = current_product.cost_price_box / current_product.units_per_box
+        if selected_product_id:
+            # Cotiza la línea con el motor de precios (precio del paquete, unidades, precio y costo unitario)
+            try:
+                line = quote([{"product_id": selected_product_id, "price_type": selected_price_type, "quantity": quantity_input, "discount": discount}]).iloc[0]
+            except ValueError as e:
+                # El producto ya no existe (por ejemplo, tras restaurar un respaldo); no se puede cotizar ni vender
+                st.error(f"Error al cotizar la venta: {e}")
+                selected_product_id = None
             else:
-                current_cost_per_unit = current_product.cost_price_box # Asumimos que para unitario, el costo de la "caja" es el costo unitario
-
-            if selected_price_type == "Caja Fria":
-                unit_price_display = current_product.price_caja_fria # Mostrar precio de caja
-                quantity_for_sale_record = quantity_input * current_product.units_per_box # Total de unidades para stock
-                unit_price_for_sale_record = current_product.price_caja_fria / current_product.units_per_box # Precio unitario real para registro
-                cost_price_at_sale_calc = current_cost_per_unit # Costo unitario al momento de la venta
-            elif selected_price_type == "Caja Caliente":
-                unit_price_display = current_product.price_caja_caliente # Mostrar precio de caja
-                quantity_for_sale_record = quantity_input * current_product.units_per_box
-                unit_price_for_sale_record = current_product.price_caja_caliente / current_product.units_per_box
-                cost_price_at_sale_calc = current_cost_per_unit
-            elif selected_price_type == "Caja Particular":
-                unit_price_display = current_product.price_caja_particular # Mostrar precio de caja
-                quantity_for_sale_record = quantity_input * current_product.units_per_box
-                unit_price_for_sale_record = current_product.price_caja_particular / current_product.units_per_box
-                cost_price_at_sale_calc = current_cost_per_unit
-            elif selected_price_type == "six-pack":
-                unit_price_display = current_product.price_six_pack # Mostrar precio de six-pack
-                quantity_for_sale_record = quantity_input * 6 # Total de unidades para stock
-                unit_price_for_sale_record = current_product.price_six_pack / 6 # Precio unitario real para registro
-                cost_price_at_sale_calc = current_cost_per_unit
-            elif selected_price_type == "Unitario":
-                unit_price_display = current_product.price_unitario # Mostrar precio unitario
-                quantity_for_sale_record = quantity_input # Total de unidades para stock
-                unit_price_for_sale_record = current_product.price_unitario # Precio unitario real para registro
-                cost_price_at_sale_calc = current_cost_per_unit
-            
-            # Calcular el precio total basado en lo que se muestra (precio de caja/six-pack/unidad)
-            total_price_display = (unit_price_display * quantity_input) - discount
-            if total_price_display < 0:
-                total_price_display = 0
+                unit_price_display = float(line["price"]) # Mostrar precio de caja/six-pack/unidad
+                quantity_for_sale_record = int(line["units_sold"]) # Total de unidades para stock
+                unit_price_for_sale_record = float(line["unit_price"]) # Precio unitario real para registro
+                cost_price_at_sale_calc = float(line["unit_cost"]) # Costo unitario al momento de la venta
+                total_price_display = float(line["total"]) # Precio total con descuento (nunca negativo)
 
         st.write(f"**Valor por Unidad ({selected_price_type}):** ${unit_price_display:,.2f}") # Muestra el valor por unidad (o caja/six-pack)
         st.write(f"**Valor Total de la Compra:** ${total_price_display:,.2f}") # Muestra el valor total
@@ -221,7 +172,8 @@ with tab2:
                     unit_price_at_sale=unit_price_for_sale_record, # Pasar el precio unitario real para el registro
                     total_price=total_price_display, # Pasar el precio total calculado
                     discount=discount, # Pasar el descuento
-                    cost_price_at_sale=cost_price_at_sale_calc # Pasar el costo unitario al momento de la venta
+                    cost_price_at_sale=cost_price_at_sale_calc, # Pasar el costo unitario al momento de la venta
+                    price_type=selected_price_type # Guardar el tipo de precio usado
                 )
                 if success:
                     st.success(message) # Muestra mensaje de éxito
@@ -236,13 +188,31 @@ with tab2:
 with tab3:
     st.header("Reportes y Stock Actual") # Encabezado de la sección de reportes
 
+    st.subheader("Alertas de Stock Bajo") # Subencabezado para las alertas de stock
+    stock_alerts = get_stock_alerts() # Obtiene solo los productos en alerta (mantenidos por triggers)
+    if stock_alerts:
+        alerts_data = []
+        for a in stock_alerts:
+            alerts_data.append({
+                "ID": a.product_id,
+                "Nombre": a.product.name if a.product else "Desconocido",
+                "Stock Actual": a.stock,
+                "Stock Mínimo": a.min_stock,
+                "En Alerta Desde": a.alert_date.strftime("%Y-%m-%d %H:%M:%S") if a.alert_date else ""
+            })
+        st.error(f"🚨 {len(alerts_data)} producto(s) con stock por debajo del mínimo.")
+        st.dataframe(pd.DataFrame(alerts_data), use_container_width=True)
+    else:
+        st.success("✅ Ningún producto está por debajo del stock mínimo.")
+    alert_product_ids = {a.product_id for a in stock_alerts} # Conjunto de productos en alerta
+
     st.subheader("Inventario Actual") # Subencabezado para el inventario actual
     current_inventory_products = get_current_inventory() # Obtiene el inventario actual
     if current_inventory_products:
         inventory_data = []
         for p in current_inventory_products:
-            # Determina si el stock actual es menor que el stock mínimo para mostrar una alarma
-            alarm_status = "🚨 ALARMA: Stock Bajo" if p.stock < p.min_stock else "✅ OK"
+            # Determina si el producto está en la tabla de alertas para mostrar una alarma
+            alarm_status = "🚨 ALARMA: Stock Bajo" if p.id in alert_product_ids else "✅ OK"
             inventory_data.append({
                 "ID": p.id,
                 "Nombre": p.name,
@@ -264,36 +234,23 @@ with tab3:
         st.info("No hay datos de inventario para mostrar.")
 
     st.subheader("Historial de Ventas") # Subencabezado para el historial de ventas
-    all_sales = get_all_sales() # Obtiene todas las ventas
-    if all_sales:
-        sales_data = []
-        for s in all_sales:
-            # Obtiene el nombre del producto asociado a la venta
-            product = get_product_by_id(s.product_id)
-            product_name = product.name if product else "Desconocido"
-            
-            # Calcular la ganancia por esta venta
-            # Ganancia = (Precio Unitario de Venta - Costo Unitario al Momento de la Venta) * Cantidad Total de Unidades Vendidas
-            profit_per_sale = (s.unit_price_at_sale - s.cost_price_at_sale) * s.quantity
-            
-            sales_data.append({
-                "ID Venta": s.id,
-                "Producto": product_name,
-                "Cantidad": s.quantity,
-                "Precio Unitario Venta": format_number_for_excel_es(s.unit_price_at_sale),
-                "Costo Unitario Venta": format_number_for_excel_es(s.cost_price_at_sale), # Mostrar el costo unitario de la venta
-                "Descuento": format_number_for_excel_es(s.discount),
-                "Precio Total": format_number_for_excel_es(s.total_price),
-                "Ganancia Venta": format_number_for_excel_es(profit_per_sale), # Nueva columna de ganancia por venta
-                "Fecha Venta": s.sale_date.strftime("%Y-%m-%d %H:%M:%S") # Formatea la fecha
-            })
-        df_sales = pd.DataFrame(sales_data)
+    # El historial se genera en un proceso aparte; si los datos no cambiaron se reutiliza el último resultado.
+    # Mientras se genera una versión nueva se sigue mostrando la última que terminó.
+    sales_job = get_job(submit_report("sales_history"))
+    if sales_job["status"] != JOB_DONE:
+        if sales_job["status"] == JOB_FAILED:
+            st.error(f"Error al generar el historial de ventas: {sales_job['error']}")
+        else:
+            show_report_progress(sales_job["id"], "Actualizando historial de ventas")
+        sales_job = get_last_finished_job("sales_history")
+    if sales_job is not None and not sales_job["result"]["data"].empty:
+        df_sales = sales_job["result"]["data"]
         st.dataframe(df_sales, use_container_width=True) # Muestra el DataFrame de ventas
 
         # Botón para descargar el historial de ventas a Excel
         st.download_button(
             label="Descargar Historial de Ventas a Excel",
-            data=to_excel(df_sales),
+            data=sales_job["result"]["excel"],
             file_name="historial_ventas.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -301,7 +258,7 @@ with tab3:
         st.write("---")
         st.subheader("Eliminar Venta")
         # Selector para elegir la venta a eliminar
-        sales_for_deletion = {f"ID: {s.id} - Producto: {get_product_by_id(s.product_id).name if get_product_by_id(s.product_id) else 'Desconocido'} - Fecha: {s.sale_date.strftime('%Y-%m-%d %H:%M')}" : s.id for s in all_sales}
+        sales_for_deletion = {f"ID: {sale_id} - Producto: {product_name} - Fecha: {str(sale_date)[:16]}" : int(sale_id) for sale_id, product_name, sale_date in zip(df_sales["ID Venta"], df_sales["Producto"], df_sales["Fecha Venta"])}
         selected_sale_to_delete_label = st.selectbox("Seleccione una Venta a Eliminar", list(sales_for_deletion.keys()), key="delete_sale_select")
         selected_sale_to_delete_id = sales_for_deletion[selected_sale_to_delete_label] if selected_sale_to_delete_label else None
 
@@ -318,9 +275,104 @@ with tab3:
                         st.error(message)
                 else:
                     st.warning("Por favor, marque la casilla para confirmar la eliminación de la venta.")
+    elif sales_job is not None:
+        st.info("No hay ventas registradas.")
+
+    st.write("---")
+    st.subheader("Ventas por Tipo de Precio")
+    sales_by_price_type = get_sales_by_price_type()
+    if sales_by_price_type:
+        price_type_data = []
+        for price_type, sales_count, units, revenue, cost in sales_by_price_type:
+            price_type_data.append({
+                "Tipo de Precio": price_type or "Sin registrar",
+                "Ventas": sales_count,
+                "Unidades": units,
+                "Ingreso": format_number_for_excel_es(revenue),
+                "Costo": format_number_for_excel_es(cost),
+                "Ganancia": format_number_for_excel_es(revenue - cost)
+            })
+        st.dataframe(pd.DataFrame(price_type_data), use_container_width=True)
     else:
         st.info("No hay ventas registradas.")
 
+    st.write("---")
+    st.subheader("Precios Históricos") # Precios y costo vigentes en una fecha
+    history_products = get_all_products()
+    if history_products:
+        history_product_options = {p.name: p.id for p in history_products}
+        history_product_name = st.selectbox("Producto", list(history_product_options.keys()), key="price_history_product")
+        history_date = st.date_input("Fecha", value=datetime.now().date(), key="price_history_date")
+        # Se consulta al final del día elegido para incluir los cambios hechos ese día
+        try:
+            historical_prices = as_of(history_product_options[history_product_name], datetime.combine(history_date, datetime.max.time()))
+        except Exception as e:
+            st.error(f"Error al consultar los precios históricos: {e}")
+        else:
+            if historical_prices:
+                history_data = [{"Tipo de Precio": price_type, "Precio": format_number_for_excel_es(historical_prices[column])} for price_type, (column, _) in PRICE_TYPES.items()]
+                history_data.append({"Tipo de Precio": "Costo por caja", "Precio": format_number_for_excel_es(historical_prices["cost_price_box"])})
+                history_data.append({"Tipo de Precio": "Costo por unidad", "Precio": format_number_for_excel_es(historical_prices["unit_cost"])})
+                st.dataframe(pd.DataFrame(history_data), use_container_width=True)
+            else:
+                st.info("No hay precios registrados para este producto en la fecha indicada.")
+    else:
+        st.info("No hay productos registrados.")
+
+    st.write("---")
+    st.subheader("Cierre de Caja") # Resumen diario congelado
+    close_date = st.date_input("Día del cierre", value=datetime.now().date(), key="daily_close_date")
+    daily_close = get_daily_close(close_date)
+    if daily_close is None:
+        st.info(f"La caja del {close_date.strftime('%Y-%m-%d')} no está cerrada.")
+        if st.button("Cerrar Caja", key="daily_close_button"):
+            success, message = close_day(close_date)
+            if success:
+                st.success(message)
+                st.rerun() # Recargar para mostrar el cierre guardado
+            else:
+                st.error(message)
+    else:
+        st.caption(f"Cierre registrado el {daily_close.closed_at.strftime('%Y-%m-%d %H:%M:%S')}")
+        if daily_close.is_stale:
+            st.warning("Se registraron ventas de este día después del cierre; las cifras guardadas están desactualizadas.")
+            if st.button("Volver a Cerrar Caja", key="daily_close_redo_button"):
+                success, message = close_day(close_date)
+                if success:
+                    st.success(message)
+                    st.rerun() # Recargar para mostrar el nuevo cierre
+                else:
+                    st.error(message)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Ventas", daily_close.sales_count)
+        col1.metric("Unidades", daily_close.units)
+        col2.metric("Ingreso Bruto", format_number_for_excel_es(daily_close.gross_revenue))
+        col2.metric("Descuentos", format_number_for_excel_es(daily_close.discounts))
+        col3.metric("Ingreso Neto", format_number_for_excel_es(daily_close.net_revenue))
+        col3.metric("Ganancia", format_number_for_excel_es(daily_close.profit))
+
+        close_items_data = []
+        for item in daily_close.items:
+            close_items_data.append({
+                "Producto": item.product_name,
+                "Ventas": item.sales_count,
+                "Unidades": item.units,
+                "Ingreso Bruto": format_number_for_excel_es(item.gross_revenue),
+                "Descuentos": format_number_for_excel_es(item.discounts),
+                "Ingreso Neto": format_number_for_excel_es(item.net_revenue),
+                "Costo": format_number_for_excel_es(item.cost),
+                "Ganancia": format_number_for_excel_es(item.profit)
+            })
+        if close_items_data:
+            df_close_items = pd.DataFrame(close_items_data)
+            st.dataframe(df_close_items, use_container_width=True)
+            st.download_button(
+                label="Descargar Cierre de Caja a Excel",
+                data=to_excel(df_close_items),
+                file_name=f"cierre_caja_{close_date.strftime('%Y-%m-%d')}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
 # --- Nueva Pestaña: Modificación Inventario ---
 with tab4:
     st.header("Modificación de Inventario")
@@ -407,28 +459,110 @@ with tab4:
 
     st.write("---")
     st.subheader("Historial de Modificaciones de Inventario")
-    modifications = get_inventory_modifications()
+    # Etiquetas para mostrar los tipos de cambio del historial
+    change_type_labels = {
+        ChangeType.PRICE: "Precio",
+        ChangeType.STOCK: "Stock",
+        ChangeType.MIN_STOCK: "Stock Mínimo",
+        ChangeType.COST: "Valor Caja",
+        ChangeType.PRODUCT_DELETION: "Eliminación de Producto",
+        ChangeType.SALE_DELETION: "Eliminación de Venta"
+    }
+    # Resultado de la última aplicación de la política de retención (automática o manual)
+    last_retention = get_last_audit_retention()
+    if last_retention is not None:
+        retention_date, retention_success, retention_message = last_retention
+        retention_text = f"Retención del historial ({retention_date.strftime('%Y-%m-%d %H:%M:%S')}): {retention_message}"
+        if retention_success:
+            st.caption(retention_text)
+        else:
+            st.error(retention_text)
+    if st.button("Aplicar Retención del Historial", key="audit_retention_button"):
+        success, message = run_audit_retention()
+        if success:
+            st.success(message)
+        else:
+            st.error(message)
+
+    modifications_page = st.number_input("Página", min_value=1, step=1, key="modifications_page")
+    modifications, modifications_total = get_inventory_modifications(page=modifications_page)
     if modifications:
         mod_data = []
-        for m in modifications:
-            product = get_product_by_id(m.product_id)
-            product_name = product.name if product else "Desconocido"
+        for m, product_name in modifications:
+            if m.change_type == ChangeType.SALE_DELETION:
+                detail = f"Venta ID {m.reference_id}: {m.quantity or 0} unidades, total {format_number_for_excel_es(m.amount)}"
+            elif m.change_type == ChangeType.PRODUCT_DELETION:
+                detail = f"Producto eliminado con stock {int(m.old_value or 0)}"
+            else:
+                detail = ""
             mod_data.append({
                 "ID Modificación": m.id,
-                "Producto": product_name,
-                "Campo Modificado": m.field_modified,
-                "Valor Anterior": m.old_value,
-                "Nuevo Valor": m.new_value,
+                "Producto": product_name or m.note or "Desconocido",
+                "Tipo de Cambio": change_type_labels.get(m.change_type, str(m.change_type)),
+                "Campo Modificado": m.field_modified or "",
+                "Valor Anterior": format_number_for_excel_es(m.old_value) if not detail else "",
+                "Nuevo Valor": format_number_for_excel_es(m.new_value) if not detail else "",
+                "Detalle": detail,
                 "Fecha Modificación": m.modification_date.strftime("%Y-%m-%d %H:%M:%S")
             })
         df_modifications = pd.DataFrame(mod_data)
+        st.caption(f"Mostrando {len(mod_data)} de {modifications_total} modificaciones (página {modifications_page}).")
         st.dataframe(df_modifications, use_container_width=True)
 
         st.download_button(
-            label="Descargar Historial de Modificaciones a Excel",
+            label="Descargar Página del Historial a Excel",
             data=to_excel(df_modifications),
             file_name="historial_modificaciones_inventario.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
+
+        # El historial completo se exporta en un proceso aparte para no bloquear la página
+        if st.button("Generar Historial Completo en Excel", key="modifications_export_button"):
+            st.session_state["modifications_export_job"] = submit_report("modifications_history")
+        modifications_export_job = get_job(st.session_state["modifications_export_job"]) if "modifications_export_job" in st.session_state else None
+        if modifications_export_job is not None:
+            if modifications_export_job["status"] == JOB_FAILED:
+                st.error(f"Error al generar el historial completo: {modifications_export_job['error']}")
+            elif modifications_export_job["status"] != JOB_DONE:
+                show_report_progress(modifications_export_job["id"], "Generando historial completo")
+            elif modifications_export_job["result"]["excel"] is not None:
+                st.download_button(
+                    label="Descargar Historial Completo de Modificaciones a Excel",
+                    data=modifications_export_job["result"]["excel"],
+                    file_name="historial_modificaciones_inventario_completo.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+    else:
+        st.info("No hay historial de modificaciones de inventario.")
+
+    st.write("---")
+    st.subheader("Respaldos de la Base de Datos")
+    # Los respaldos se hacen en línea, sin detener las ventas
+    if st.button("Crear Respaldo Ahora", key="create_backup_button"):
+        success, message = create_backup()
+        if success:
+            st.success(message)
+        else:
+            st.error(message)
+
+    available_backups = list_backups()
+    if available_backups:
+        backups_data = [{"Fecha Respaldo": t.strftime("%Y-%m-%d %H:%M:%S"), "Archivo": path} for t, path in available_backups]
+        st.dataframe(pd.DataFrame(backups_data), use_container_width=True)
+
+        # Restauración a un punto en el tiempo: se usa el respaldo más reciente anterior a la fecha elegida
+        restore_date = st.date_input("Restaurar al estado del día", value=datetime.now().date(), key="restore_backup_date")
+        restore_time = st.time_input("Hora", value=datetime.now().time().replace(second=0, microsecond=0), key="restore_backup_time")
+        confirm_restore = st.checkbox("Confirmar restauración (el estado actual se respalda antes de restaurar)", key="confirm_restore_backup")
+        if st.button("Restaurar Respaldo", key="restore_backup_button"):
+            if confirm_restore:
+                success, message = restore_backup(datetime.combine(restore_date, restore_time))
+                if success:
+                    st.success(message)
+                    st.rerun() # Recargar para reflejar los datos restaurados
+                else:
+                    st.error(message)
+            else:
+                st.warning("Por favor, marque la casilla para confirmar la restauración.")
     else:
-        st.info("No hay historial de modificaciones de inventario.")
\ No newline at end of file
+        st.info("Todavía no hay respaldos de la base de datos.")
\ No newline at end of file